@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+# Benchmarks the VPCPS LOI Tool on synthetic IP location spreadsheets.
+#
+# Spreadsheets in the MajorProjectData.xlsx layout (CUSTOMER ID, CUSTOMER NAME,
+# IP ADDRESS, IP LAT and IP LON) are generated inside the extent of the
+# jurisdiction layer, with a share of the rows clustered around hotspots.
+# For each size the full tool is run and then each stage on its own, and the
+# wall time, peak memory and feature counts are written to a JSON results
+# file. The peak memory is measured separately for every stage, as in the
+# tool's trace, and the caches the tool keeps are put in the work directory. Given a baseline results file, any stage that has become
+# slower than the tolerance allows is reported and the script exits with 1.
+#
+# Run it with the Python environment that comes with QGIS, for example from
+# the OSGeo4W shell:
+#
+#     python VPCPSLOIBenchmark.py --sizes 1000 10000 100000 --output results.json
+#     python VPCPSLOIBenchmark.py --sizes 1000 10000 100000 --baseline results.json
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from qgis.core import (QgsCoordinateReferenceSystem,
+                       QgsCoordinateTransform,
+                       QgsFeature,
+                       QgsField,
+                       QgsFields,
+                       QgsProject,
+                       QgsVectorFileWriter,
+                       QgsVectorLayer,
+                       QgsWkbTypes)
+from qgis.PyQt.QtCore import QVariant
+
+from VPCPSLOIQgis import startQgis
+
+#The sample data sits next to this script
+DataPath = os.path.dirname(os.path.abspath(__file__))
+
+def generateSpreadsheet(SpreadsheetPath, Rows, Extent, Hotspots, Spread, ClusteredShare, Customers, Seed):
+    """
+    Writes a synthetic IP locations spreadsheet of Rows rows. ClusteredShare
+    of the rows are scattered Spread metres around one of Hotspots random
+    hotspots and the rest are spread evenly over Extent, a longitude and
+    latitude rectangle. Rows are shared between Customers distinct customers.
+    """
+    Random = np.random.default_rng(Seed)
+    HotspotLons = Random.uniform(Extent.xMinimum(), Extent.xMaximum(), Hotspots)
+    HotspotLats = Random.uniform(Extent.yMinimum(), Extent.yMaximum(), Hotspots)
+    Lons = Random.uniform(Extent.xMinimum(), Extent.xMaximum(), Rows)
+    Lats = Random.uniform(Extent.yMinimum(), Extent.yMaximum(), Rows)
+    Clustered = Random.random(Rows) < ClusteredShare
+    HotspotOfRow = Random.integers(0, Hotspots, Rows)
+    # Convert the spread from metres to degrees at each hotspot's latitude
+    Lats[Clustered] = HotspotLats[HotspotOfRow[Clustered]] + Random.normal(0, Spread / 111320.0, Clustered.sum())
+    Lons[Clustered] = HotspotLons[HotspotOfRow[Clustered]] + Random.normal(0, 1, Clustered.sum()) * Spread / (111320.0 * np.cos(np.radians(Lats[Clustered])))
+    CustomerOfRow = Random.integers(0, Customers, Rows)
+    Octets = Random.integers(1, 255, (Rows, 4))
+
+    fields = QgsFields()
+    for field in [QgsField('CUSTOMER ID', QVariant.LongLong), QgsField('CUSTOMER NAME', QVariant.String),
+                  QgsField('IP ADDRESS', QVariant.String), QgsField('IP LAT', QVariant.Double), QgsField('IP LON', QVariant.Double)]:
+        fields.append(field)
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = 'XLSX'
+    options.layerName = 'Sheet1'
+    Writer = QgsVectorFileWriter.create(SpreadsheetPath, fields, QgsWkbTypes.NoGeometry, QgsCoordinateReferenceSystem(),
+                                        QgsProject.instance().transformContext(), options)
+    Features = []
+    for Row in range(Rows):
+        Feature = QgsFeature(fields)
+        Feature.setAttributes([1000000 + int(CustomerOfRow[Row]), 'Name {}'.format(CustomerOfRow[Row]),
+                               '.'.join(str(Octet) for Octet in Octets[Row].tolist()), float(Lats[Row]), float(Lons[Row])])
+        Features.append(Feature)
+        if len(Features) == 50000:
+            Writer.addFeatures(Features)
+            Features = []
+    Writer.addFeatures(Features)
+    del Writer
+    return SpreadsheetPath
+
+def measure(Tool, Results, Stage, Function, *Arguments):
+    """
+    Runs Function, adding its wall time and its own peak memory, measured
+    the same way as the stages in the tool's trace, to Results under Stage,
+    and returns what Function returned.
+    """
+    Tool.beginMemoryMeasurement()
+    try:
+        Memory = Tool.startMemoryPeak()
+        Start = time.perf_counter()
+        Returned = Function(*Arguments)
+        Seconds = time.perf_counter() - Start
+        Results[Stage] = {'seconds': Seconds, 'peak_mb': Tool.memoryPeak(Memory)[1]}
+    finally:
+        # Tracing is stopped again so it never slows the stages measured after this one
+        Tool.endMemoryMeasurement()
+    return Returned
+
+def benchmarkSize(Tool, Rows, Arguments, WorkPath):
+    """
+    Generates one spreadsheet of Rows rows, then runs the whole tool and
+    each of its stages on it and returns their measurements.
+    """
+    from qgis import processing
+
+    JurisdictionLayer = QgsVectorLayer(Arguments.jurisdiction, 'Jurisdiction', 'ogr')
+    crs = QgsCoordinateReferenceSystem(Arguments.crs)
+    ToLonLat = QgsCoordinateTransform(JurisdictionLayer.crs(), QgsCoordinateReferenceSystem('EPSG:4326'), QgsProject.instance())
+    Extent = ToLonLat.transformBoundingBox(JurisdictionLayer.extent())
+    SpreadsheetPath = os.path.join(WorkPath, 'Synthetic_{}.xlsx'.format(Rows))
+    generateSpreadsheet(SpreadsheetPath, Rows, Extent, Arguments.hotspots, Arguments.spread,
+                        Arguments.clustered, Arguments.customers, Arguments.seed + Rows)
+    Stages = {}
+    Counts = {'rows': Rows}
+
+    # The whole tool, as it is run from the processing toolbox. Every size
+    # starts with empty caches of its own in the work directory, so runs are
+    # compared cold against the baseline and the QGIS profile is left alone
+    Tool.CacheRoot = os.path.join(WorkPath, 'Cache_{}'.format(Rows))
+    Tool.ReferenceCache.Resident.clear()
+    AnalysisPath = os.path.join(WorkPath, 'Analysis_{}'.format(Rows))
+    os.makedirs(AnalysisPath, exist_ok=True)
+    Tool_params = {
+        Tool.VPCPSLOITool.DataPoints: SpreadsheetPath,
+        Tool.VPCPSLOITool.CoordRefSystem: crs,
+        Tool.VPCPSLOITool.JurisdictionPGN: Arguments.jurisdiction,
+        Tool.VPCPSLOITool.VICPolAOR: Arguments.aor,
+        Tool.VPCPSLOITool.AddressLocs: Arguments.addresses,
+        Tool.VPCPSLOITool.Distance: Arguments.distance,
+        Tool.VPCPSLOITool.Analysispath: AnalysisPath,
+        Tool.VPCPSLOITool.OutputFile: 'LOI_{}'.format(Rows),
+        Tool.VPCPSLOITool.TraceFile: True,
+        Tool.VPCPSLOITool.LoadOutputs: False
+        }
+    # The tool measures the memory of its own stages, which a measurement around it would stop
+    Start = time.perf_counter()
+    Outputs = processing.run(Tool.VPCPSLOITool(), Tool_params)
+    Stages['pipeline'] = {'seconds': time.perf_counter() - Start, 'peak_mb': None}
+    Counts['loi_features'] = QgsVectorLayer(Outputs[Tool.VPCPSLOITool.OutputLOI], 'LOI', 'ogr').featureCount()
+    # The stages of the whole tool, as recorded in its trace file. The trace
+    # measures the peak of each stage afresh, so the peak of the whole tool
+    # is the highest of its stages
+    with open(Outputs[Tool.VPCPSLOITool.OutputTrace]) as TraceFile:
+        for Event in json.load(TraceFile)['traceEvents']:
+            Stages['pipeline: ' + Event['name']] = {'seconds': Event['dur'] / 1000000.0, 'peak_mb': Event['args'].get('peak_memory_mb', Event['args'].get('peak_allocated_mb'))}
+    StagePeaks = [Measured['peak_mb'] for Stage, Measured in Stages.items() if Stage.startswith('pipeline: ') and Measured['peak_mb'] is not None]
+    Stages['pipeline']['peak_mb'] = max(StagePeaks) if StagePeaks else None
+
+    # Each stage on its own, cold and then warm for the cached spreadsheet ingest
+    Source = QgsVectorLayer(SpreadsheetPath, 'Spreadsheet', 'ogr')
+    FieldNames = {'IP LON': 'IP LON', 'IP LAT': 'IP LAT', 'CUSTOMER I': 'CUSTOMER ID', 'CUSTOMER N': 'CUSTOMER NAME', 'IP ADDRESS': 'IP ADDRESS'}
+    IPColumns = measure(Tool, Stages, 'ingest', Tool.IPLocationColumns.fromSource, Source, FieldNames)
+    CachePath = tempfile.mkdtemp(dir=WorkPath)
+    Tool.readIPLocations(Source, SpreadsheetPath, FieldNames, CachePath)
+    measure(Tool, Stages, 'ingest_cached', Tool.readIPLocations, Source, SpreadsheetPath, FieldNames, CachePath)
+    Counts['ingested'] = len(IPColumns)
+
+    Boundary = measure(Tool, Stages, 'jurisdiction', lambda: Tool.QgsGeometry.unaryUnion(
+        [Feature.geometry() for Feature in JurisdictionLayer.getFeatures()]))
+    ToProject = QgsCoordinateTransform(QgsCoordinateReferenceSystem('EPSG:4326'), crs, QgsProject.instance())
+    if JurisdictionLayer.crs() != crs:
+        Boundary.transform(QgsCoordinateTransform(JurisdictionLayer.crs(), crs, QgsProject.instance()))
+    PointXs, PointYs, PointRows = measure(Tool, Stages, 'project_and_clip', Tool.projectAndClip, IPColumns.Lons, IPColumns.Lats, ToProject, Boundary)
+    Counts['in_jurisdiction'] = len(PointRows)
+
+    Labels = measure(Tool, Stages, 'cluster', Tool.clusterPoints, PointXs, PointYs, 2*Arguments.distance)
+    Counts['locations'] = int(Labels.max()) + 1 if Labels.size else 0
+    State = measure(Tool, Stages, 'locations', Tool.LocationState.build, {}, IPColumns, PointRows, PointXs, PointYs, Arguments.distance)
+    measure(Tool, Stages, 'score', Tool.scoreLocations, State.Incidents, State.Identities)
+    return {'stages': Stages, 'counts': Counts}
+
+def regressions(Results, Baseline, Tolerance, MinimumSeconds):
+    """
+    Returns a description of every stage that took longer than its baseline
+    time by more than Tolerance, ignoring changes under MinimumSeconds.
+    """
+    Slower = []
+    for Size, SizeResults in Results['sizes'].items():
+        BaselineStages = Baseline.get('sizes', {}).get(Size, {}).get('stages', {})
+        for Stage, Measured in SizeResults['stages'].items():
+            Before = BaselineStages.get(Stage)
+            if Before is None:
+                continue
+            Allowed = max(Before['seconds'] * (1 + Tolerance), Before['seconds'] + MinimumSeconds)
+            if Measured['seconds'] > Allowed:
+                Slower.append('{} rows, {}: {:.3f}s against a baseline of {:.3f}s'.format(Size, Stage, Measured['seconds'], Before['seconds']))
+    return Slower
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the VPCPS LOI Tool on synthetic IP location spreadsheets.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='spreadsheet row counts, up to 1000000')
+    parser.add_argument('--hotspots', type=int, default=200, help='number of hotspots rows are clustered around')
+    parser.add_argument('--spread', type=float, default=75.0, help='scatter of clustered rows around their hotspot in metres')
+    parser.add_argument('--clustered', type=float, default=0.8, help='share of rows clustered around hotspots')
+    parser.add_argument('--customers', type=int, default=2000, help='number of distinct customers')
+    parser.add_argument('--distance', type=int, default=50, help='buffer distance in metres')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the spreadsheets')
+    parser.add_argument('--crs', default='EPSG:7855', help='projected coordinate system of the analysis')
+    parser.add_argument('--jurisdiction', default=os.path.join(DataPath, 'Sample_Jurisdication_Data.shp'))
+    parser.add_argument('--aor', default=os.path.join(DataPath, 'Sample_VICPOL_AOR.shp'))
+    parser.add_argument('--addresses', default=os.path.join(DataPath, 'Sample_Address_Data.shp'))
+    parser.add_argument('--work', default=None, help='directory for the spreadsheets and outputs, a temporary directory by default')
+    parser.add_argument('--output', default='VPCPSLOIBenchmark.json', help='JSON results file to write')
+    parser.add_argument('--baseline', default=None, help='JSON results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed slowdown against the baseline, 0.25 is 25%%')
+    parser.add_argument('--minimum', type=float, default=0.05, help='ignore slowdowns of fewer seconds than this')
+    Arguments = parser.parse_args()
+
+    Application = startQgis()
+    sys.path.insert(0, DataPath)
+    import VPCPSLOITool as Tool
+
+    WorkPath = Arguments.work or tempfile.mkdtemp(prefix='VPCPSLOIBenchmark')
+    Results = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'platform': platform.platform(),
+               'qgis': Tool.Qgis.QGIS_VERSION, 'settings': {Name: Value for Name, Value in vars(Arguments).items()
+                                                             if Name not in ('output', 'baseline', 'work')},
+               'sizes': {}}
+    for Rows in Arguments.sizes:
+        print('Benchmarking {} rows'.format(Rows))
+        Results['sizes'][str(Rows)] = benchmarkSize(Tool, Rows, Arguments, WorkPath)
+        for Stage, Measured in Results['sizes'][str(Rows)]['stages'].items():
+            print('  {:<32} {:>9.3f}s  {:>9} MB'.format(Stage, Measured['seconds'],
+                                                     'n/a' if Measured['peak_mb'] is None else '{:.0f}'.format(Measured['peak_mb'])))
+    with open(Arguments.output, 'w') as OutputFile:
+        json.dump(Results, OutputFile, indent=1)
+    print('Results written to {}'.format(Arguments.output))
+
+    ExitCode = 0
+    if Arguments.baseline:
+        with open(Arguments.baseline) as BaselineFile:
+            Slower = regressions(Results, json.load(BaselineFile), Arguments.tolerance, Arguments.minimum)
+        for Regression in Slower:
+            print('REGRESSION ' + Regression)
+        ExitCode = 1 if Slower else 0
+    Application.exitQgis()
+    return ExitCode
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+# Starts QGIS outside its interface for the scripts that run the VPCPS LOI
+# Tool on their own, the benchmark and the service. The tool itself imports
+# processing, so QGIS has to be started before the tool is imported.
+
+import os
+import sys
+
+from qgis.core import QgsApplication
+
+def startQgis():
+    """
+    Starts QGIS without a user interface and registers the processing
+    algorithms the tool runs.
+    """
+    QgsApplication.setPrefixPath(os.environ.get('QGIS_PREFIX_PATH', QgsApplication.prefixPath()), True)
+    Application = QgsApplication([], False)
+    Application.initQgis()
+    sys.path.append(os.path.join(QgsApplication.prefixPath(), 'python', 'plugins'))
+    from processing.core.Processing import Processing
+    from qgis.analysis import QgsNativeAlgorithms
+    Processing.initialize()
+    if QgsApplication.processingRegistry().providerById('native') is None:
+        QgsApplication.processingRegistry().addProvider(QgsNativeAlgorithms())
+    return Application
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+# Serves the VPCPS LOI Tool on localhost for repeated analyses.
+#
+# QGIS and processing are started once, and the jurisdiction, police area of
+# responsibility and address layers are reprojected and indexed at start up
+# and kept in memory. Each job then only pays for its own spreadsheet.
+# Jobs wait in a bounded queue for a pool of worker threads. When the queue
+# is full, new jobs are refused with 503 rather than piling up.
+#
+# Run it with the Python environment that comes with QGIS, for example from
+# the OSGeo4W shell:
+#
+#     python VPCPSLOIService.py --port 8765 --workers 2 --crs EPSG:7855
+#
+# and submit jobs as JSON with Content-Type: application/json, only the
+# spreadsheet is required:
+#
+#     POST /jobs         {"spreadsheet": "D:/Cases/Case1.xlsx", "distance": [25, 50], "output": "Case1"}
+#                        "format" may be Shapefile, GeoPackage or FlatGeobuf, and "crs",
+#                        "incremental", "trace" and "analysis" may also be given
+#                        answers 202 with the job id, or with the finished job when ?wait=1 is added
+#     GET  /jobs/<id>    the status of a job, and its outputs once it has finished
+#     GET  /jobs/<id>/files/<name>   an output file of a finished job, one of those it lists
+#     DELETE /jobs/<id>  cancels a queued or running job
+#     GET  /health       the number of queued and running jobs
+#
+# "output" and "analysis" are plain names, not paths. A job with an analysis
+# name writes to that directory under --analysis-root, so incremental jobs
+# can find the state of the previous run, and every other job writes to a
+# directory of its own under --work.
+
+import argparse
+import collections
+import json
+import os
+import queue
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from qgis.core import (QgsCoordinateReferenceSystem,
+                       QgsProcessingContext,
+                       QgsProcessingFeedback,
+                       QgsProject)
+
+#The tool and the sample data sit next to this script
+DataPath = os.path.dirname(os.path.abspath(__file__))
+
+class LOIService:
+    """
+    Runs LOI jobs from a bounded queue on a pool of worker threads and keeps
+    the state of the most recent jobs for their clients to read.
+    """
+
+    # Finished jobs kept for their clients, the oldest are forgotten first
+    MaxFinishedJobs = 1000
+    # The settings a job can give, every other setting is the service's own
+    RequestKeys = ['spreadsheet', 'distance', 'output', 'format', 'crs', 'incremental', 'trace', 'analysis']
+    # Output and analysis names, which must not reach outside their directory
+    NamePattern = re.compile(r'^[A-Za-z0-9_][A-Za-z0-9 _.-]*$')
+    # The files written beside a shapefile that are served with it
+    ShapefileParts = ['.shx', '.dbf', '.prj', '.cpg']
+
+    def __init__(self, Tool, Defaults, WorkPath, Workers, QueueSize, AnalysisRoot=None):
+        self.Tool = Tool
+        self.Defaults = Defaults
+        self.WorkPath = WorkPath
+        self.AnalysisRoot = AnalysisRoot or WorkPath
+        self.Queue = queue.Queue(maxsize=QueueSize)
+        self.Jobs = collections.OrderedDict()
+        self.Lock = threading.Lock()
+        self.Threads = [threading.Thread(target=self.work, name='LOIWorker{}'.format(Index), daemon=True) for Index in range(Workers)]
+
+    def warm(self):
+        """
+        Reprojects and indexes the default reference layers, so the first job
+        finds them resident like every later one.
+        """
+        crs = QgsCoordinateReferenceSystem(self.Defaults['crs'])
+        context = QgsProcessingContext()
+        context.setProject(QgsProject.instance())
+        References = self.Tool.ReferenceCache(self.Tool.cacheDirectory('reference'))
+        for Name in ['jurisdiction', 'aor', 'addresses', 'stations']:
+            if self.Defaults.get(Name):
+                Start = time.perf_counter()
+                try:
+                    References.layer(self.Defaults[Name], crs, context, QgsProcessingFeedback())
+                except Exception as Error:
+                    print('Could not load the {} reference layer, jobs will load it: {}'.format(Name, Error))
+                    continue
+                print('Loaded the {} reference layer in {:.1f}s'.format(Name, time.perf_counter() - Start))
+
+    def start(self):
+        for Thread in self.Threads:
+            Thread.start()
+
+    def parameters(self, Job):
+        """
+        Returns the tool parameters of a job, filling in the service defaults.
+        Outputs are written to a directory of the job's own unless the job
+        names an analysis directory, as an incremental job has to.
+        """
+        Settings = dict(self.Defaults)
+        Settings.update({Name: Value for Name, Value in Job['Request'].items() if Value is not None})
+        if Settings.get('analysis'):
+            AnalysisPath = os.path.join(self.AnalysisRoot, Settings['analysis'], 'Analysis')
+        else:
+            AnalysisPath = os.path.join(self.WorkPath, Job['Id'], 'Analysis')
+        os.makedirs(AnalysisPath, exist_ok=True)
+        Algorithm = self.Tool.VPCPSLOITool
+        # Several distances may be given as a list or as a string separated by commas
+        Distance = Settings.get('distance', 50)
+        if isinstance(Distance, (list, tuple)):
+            Distance = ','.join(str(Value) for Value in Distance)
+        Parameters = {
+            Algorithm.DataPoints: Settings['spreadsheet'],
+            Algorithm.CoordRefSystem: QgsCoordinateReferenceSystem(Settings['crs']),
+            Algorithm.JurisdictionPGN: Settings['jurisdiction'],
+            Algorithm.VICPolAOR: Settings['aor'],
+            Algorithm.AddressLocs: Settings['addresses'],
+            Algorithm.Distance: str(Distance),
+            Algorithm.Analysispath: AnalysisPath,
+            Algorithm.OutputFile: Settings.get('output', 'LOI'),
+            Algorithm.OutputFormat: [Format[0] for Format in Algorithm.OutputFormats].index(Settings.get('format', 'Shapefile')),
+            Algorithm.Incremental: bool(Settings.get('incremental', False)),
+            Algorithm.TraceFile: bool(Settings.get('trace', False)),
+            Algorithm.LoadOutputs: False
+            }
+        if Settings.get('stations'):
+            Parameters[Algorithm.StationPoints] = Settings['stations']
+        Job['OutputPath'] = os.path.dirname(os.path.normpath(AnalysisPath))
+        return Parameters
+
+    def submit(self, Request):
+        """
+        Queues a job and returns it, or None when the queue is full.
+        """
+        if not isinstance(Request, dict) or not Request.get('spreadsheet'):
+            raise ValueError('A job needs a spreadsheet')
+        Unknown = sorted(set(Request) - set(self.RequestKeys))
+        if Unknown:
+            raise ValueError('A job cannot set {}, only {}'.format(', '.join(Unknown), ', '.join(self.RequestKeys)))
+        for Name in ['output', 'analysis']:
+            Value = Request.get(Name)
+            if Value is not None and not (isinstance(Value, str) and self.NamePattern.match(Value) and '..' not in Value):
+                raise ValueError('The {} must be a plain name, not {!r}'.format(Name, Value))
+        if Request.get('format') is not None and Request['format'] not in [Format[0] for Format in self.Tool.VPCPSLOITool.OutputFormats]:
+            raise ValueError('Unknown format {!r}'.format(Request['format']))
+        Job = {'Id': uuid.uuid4().hex, 'Request': Request, 'Status': 'queued', 'Submitted': time.time(),
+               'Progress': 0.0, 'Outputs': None, 'Files': {}, 'Error': None, 'Seconds': None,
+               'Feedback': QgsProcessingFeedback(), 'Done': threading.Event()}
+        with self.Lock:
+            try:
+                self.Queue.put_nowait(Job)
+            except queue.Full:
+                return None
+            self.Jobs[Job['Id']] = Job
+            Forgotten = self.forget()
+        for Job in Forgotten:
+            self.remove(Job)
+        return Job
+
+    def forget(self):
+        """
+        Forgets the oldest finished jobs beyond MaxFinishedJobs and returns
+        them, for their outputs to be removed.
+        """
+        Finished = [JobId for JobId, Job in self.Jobs.items() if Job['Done'].is_set()]
+        return [self.Jobs.pop(JobId) for JobId in Finished[:max(0, len(Finished) - self.MaxFinishedJobs)]]
+
+    def remove(self, Job):
+        """
+        Deletes the directory a job wrote its outputs to, when it was the
+        job's own rather than a named analysis directory.
+        """
+        JobPath = os.path.join(self.WorkPath, Job['Id'])
+        if not Job['Request'].get('analysis') and os.path.isdir(JobPath):
+            shutil.rmtree(JobPath, ignore_errors=True)
+
+    def work(self):
+        """
+        Runs queued jobs one after another, on one worker thread.
+        """
+        from qgis import processing
+        while True:
+            Job = self.Queue.get()
+            try:
+                if Job['Feedback'].isCanceled():
+                    Job['Status'] = 'canceled'
+                    continue
+                Job['Status'] = 'running'
+                Start = time.perf_counter()
+                Job['Feedback'].progressChanged.connect(lambda Progress, Job=Job: Job.update(Progress=Progress))
+                context = QgsProcessingContext()
+                context.setProject(QgsProject.instance())
+                Outputs = processing.run(self.Tool.VPCPSLOITool(), self.parameters(Job), context=context, feedback=Job['Feedback'])
+                Job['Outputs'] = {Name: Value for Name, Value in Outputs.items() if isinstance(Value, str)}
+                Job['Files'] = self.files(Job['Outputs'].values())
+                Job['Status'] = 'canceled' if Job['Feedback'].isCanceled() else 'finished'
+                Job['Seconds'] = time.perf_counter() - Start
+            except Exception as Error:
+                # A job canceled while running ends with the tool raising, that is not a failure
+                Job['Status'] = 'canceled' if Job['Feedback'].isCanceled() else 'failed'
+                Job['Error'] = str(Error)
+            finally:
+                Job['Done'].set()
+                self.Queue.task_done()
+
+    def files(self, OutputPaths):
+        """
+        Returns the files a job may serve by name: its outputs, with the parts
+        of a shapefile output beside it.
+        """
+        Files = {}
+        for OutputPath in OutputPaths:
+            Parts = [OutputPath]
+            if OutputPath.lower().endswith('.shp'):
+                Parts += [os.path.splitext(OutputPath)[0] + Extension for Extension in self.ShapefileParts]
+            for FilePath in Parts:
+                if os.path.isfile(FilePath):
+                    Files[os.path.basename(FilePath)] = FilePath
+        return Files
+
+    def job(self, JobId):
+        with self.Lock:
+            return self.Jobs.get(JobId)
+
+    def describe(self, Job):
+        """
+        Returns the state of a job as it is sent to clients.
+        """
+        return {'id': Job['Id'], 'status': Job['Status'], 'progress': Job['Progress'], 'outputs': Job['Outputs'],
+                'seconds': Job['Seconds'], 'error': Job['Error'],
+                'files': sorted(Job['Files']) if Job['Status'] == 'finished' else None}
+
+    def health(self):
+        with self.Lock:
+            Running = sum(1 for Job in self.Jobs.values() if Job['Status'] == 'running')
+        return {'queued': self.Queue.qsize(), 'running': Running, 'workers': len(self.Threads), 'queue_size': self.Queue.maxsize}
+
+class LOIRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the HTTP requests of the service with JSON, or with the output
+    file asked for.
+    """
+
+    Service = None
+
+    def reply(self, Status, Body):
+        Content = json.dumps(Body).encode('utf-8')
+        self.send_response(Status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(Content)))
+        if Status == 503:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(Content)
+
+    def do_GET(self):
+        Parts = [Part for Part in urlparse(self.path).path.split('/') if Part]
+        if Parts == ['health']:
+            return self.reply(200, self.Service.health())
+        if len(Parts) >= 2 and Parts[0] == 'jobs':
+            Job = self.Service.job(Parts[1])
+            if Job is None:
+                return self.reply(404, {'error': 'No job {}'.format(Parts[1])})
+            if len(Parts) == 2:
+                return self.reply(200, self.Service.describe(Job))
+            if len(Parts) == 4 and Parts[2] == 'files' and Job['Status'] == 'finished':
+                return self.sendFile(Job, Parts[3])
+        self.reply(404, {'error': 'Not found'})
+
+    def sendFile(self, Job, FileName):
+        """
+        Sends one of the output files listed for a finished job.
+        """
+        FilePath = Job['Files'].get(FileName)
+        if FilePath is None or not os.path.isfile(FilePath):
+            return self.reply(404, {'error': 'No file {}'.format(FileName)})
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(os.path.getsize(FilePath)))
+        self.send_header('Content-Disposition', 'attachment; filename="{}"'.format(os.path.basename(FilePath)))
+        self.end_headers()
+        with open(FilePath, 'rb') as File:
+            for Block in iter(lambda: File.read(1048576), b''):
+                self.wfile.write(Block)
+
+    def do_POST(self):
+        Url = urlparse(self.path)
+        if [Part for Part in Url.path.split('/') if Part] != ['jobs']:
+            return self.reply(404, {'error': 'Not found'})
+        # A web page can only send JSON to the service after a preflight check the service never answers
+        if self.headers.get('Content-Type', '').split(';')[0].strip().lower() != 'application/json':
+            return self.reply(415, {'error': 'Jobs must be sent as application/json'})
+        try:
+            Request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            Job = self.Service.submit(Request)
+        except ValueError as Error:
+            return self.reply(400, {'error': str(Error)})
+        if Job is None:
+            return self.reply(503, {'error': 'The job queue is full'})
+        if parse_qs(Url.query).get('wait', ['0'])[0] not in ('0', ''):
+            Job['Done'].wait()
+            return self.reply(200, self.Service.describe(Job))
+        self.reply(202, self.Service.describe(Job))
+
+    def do_DELETE(self):
+        Parts = [Part for Part in urlparse(self.path).path.split('/') if Part]
+        Job = self.Service.job(Parts[1]) if len(Parts) == 2 and Parts[0] == 'jobs' else None
+        if Job is None:
+            return self.reply(404, {'error': 'Not found'})
+        Job['Feedback'].cancel()
+        self.reply(200, self.Service.describe(Job))
+
+    def log_message(self, format, *args):
+        print('{} {}'.format(self.address_string(), format % args))
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the VPCPS LOI Tool on localhost with the reference layers kept in memory.')
+    parser.add_argument('--port', type=int, default=8765, help='port to listen on, on 127.0.0.1 only')
+    parser.add_argument('--workers', type=int, default=2, help='number of jobs run at the same time')
+    parser.add_argument('--queue', type=int, default=16, help='number of jobs that can wait before new jobs are refused')
+    parser.add_argument('--crs', default='EPSG:7855', help='default projected coordinate system of the analysis')
+    parser.add_argument('--jurisdiction', default=os.path.join(DataPath, 'Sample_Jurisdication_Data.shp'))
+    parser.add_argument('--aor', default=os.path.join(DataPath, 'Sample_VICPOL_AOR.shp'))
+    parser.add_argument('--addresses', default=os.path.join(DataPath, 'Sample_Address_Data.shp'))
+    parser.add_argument('--stations', default=None, help='police station points, optional')
+    parser.add_argument('--distance', default='50', help='default buffer distance, or distances separated by commas')
+    parser.add_argument('--work', default=None, help='directory for job outputs, a temporary directory by default')
+    parser.add_argument('--analysis-root', default=None, help='directory holding the named analysis directories of jobs, --work by default')
+    Arguments = parser.parse_args()
+
+    sys.path.insert(0, DataPath)
+    from VPCPSLOIQgis import startQgis
+    Application = startQgis()
+    import VPCPSLOITool as Tool
+
+    Defaults = {Name: getattr(Arguments, Name) for Name in ['crs', 'jurisdiction', 'aor', 'addresses', 'stations', 'distance']}
+    Service = LOIService(Tool, Defaults, Arguments.work or tempfile.mkdtemp(prefix='VPCPSLOIService'), Arguments.workers, Arguments.queue,
+                         Arguments.analysis_root)
+    Service.warm()
+    Service.start()
+    LOIRequestHandler.Service = Service
+    Server = ThreadingHTTPServer(('127.0.0.1', Arguments.port), LOIRequestHandler)
+    print('Serving the VPCPS LOI Tool on http://127.0.0.1:{}, writing job outputs to {}'.format(Arguments.port, Service.WorkPath))
+    try:
+        Server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    Server.server_close()
+    Application.exitQgis()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -25,9 +25,31 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterCrs,
                        QgsAggregateCalculator,
                        QgsVectorLayer,
+                       QgsFeatureRequest,
+                       QgsFeature,
+                       QgsFields,
+                       QgsGeometry,
+                       QgsPointXY,
+                       QgsPoint,
+                       QgsLineString,
+                       QgsCoordinateTransform,
+                       QgsCsException,
+                       QgsWkbTypes,
+                       QgsApplication,
+                       QgsSpatialIndex,
+                       NULL,
                        QgsProcessingParameterNumber,
                        QgsProcessingParameterString,
+                       QgsProcessingParameterBoolean,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterField,
+                       QgsProcessingUtils,
+                       QgsProcessingContext,
+                       QgsProcessingMultiStepFeedback,
+                       QgsProcessingOutputVectorLayer,
+                       QgsProcessingOutputFile,
                        QgsVectorDataProvider,
+                       QgsVectorFileWriter,
                        QgsProcessingAlgorithm,
                        QgsProcessingParameterFolderDestination,
                        QgsProcessingParameterFileDestination,
@@ -35,10 +57,1410 @@ from qgis.core import (QgsProcessing,
                        QgsProcessingParameterFeatureSink)
 from qgis import processing
 from qgis.PyQt.QtCore import QVariant
-from qgis.utils import iface
 from qgis.core import Qgis
 import os
+import sys
+import csv
 import glob
+import hashlib
+import json
+import multiprocessing
+import concurrent.futures
+import pickle
+import re
+import shutil
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import numpy as np
+
+def normaliseIndex(values):
+    """
+    Returns values scaled from 0 to 1 between their minimum and maximum.
+    When every value is the same there is no range to scale over, so every
+    value scores 0 rather than dividing by zero.
+    """
+    values = np.asarray(values, dtype=float)
+    if values.size == 0:
+        return values
+    ValueMin = values.min()
+    ValueRange = values.max() - ValueMin
+    if ValueRange == 0:
+        return np.zeros_like(values)
+    return (values - ValueMin) / ValueRange
+
+def scoreLocations(Incidents, Identities):
+    """
+    Returns the incident index, identity index and combined index score for
+    arrays of INCIDENTS and IDENTITIES counts, one entry per location.
+    """
+    IncidentIndex = normaliseIndex(Incidents)
+    IdentityIndex = normaliseIndex(Identities)
+    LocIndex = ((IncidentIndex*0.5)+(IdentityIndex*0.5))*100
+    return IncidentIndex, IdentityIndex, LocIndex
+
+def clusterPoints(xs, ys, LinkDistance):
+    """
+    Groups points into locations, where any two points no more than
+    LinkDistance apart belong to the same location, and returns a location
+    label from 0 for each point.
+    Points are hashed into grid cells small enough that every point in a cell
+    is within LinkDistance of the others, so each cell starts as one location
+    and only neighbouring cells need distance checks before their locations
+    are merged with union-find.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if xs.size == 0:
+        return np.zeros(0, dtype=np.int64)
+    # Many logins share the same coordinates, so each distinct site is linked once
+    Sites, SiteOfPoint = np.unique(np.column_stack((xs, ys)), axis=0, return_inverse=True)
+    SiteOfPoint = SiteOfPoint.reshape(-1)
+    xs = Sites[:, 0]
+    ys = Sites[:, 1]
+    CellSize = LinkDistance / np.sqrt(2.0)
+    CellXs = np.floor(xs / CellSize).astype(np.int64)
+    CellYs = np.floor(ys / CellSize).astype(np.int64)
+    # Encode each cell as one sortable key, leaving room for the neighbour offsets
+    CellXs -= CellXs.min() - 2
+    CellYs -= CellYs.min() - 2
+    Height = int(CellYs.max()) + 3
+    Keys, CellOfSite = np.unique(CellXs * Height + CellYs, return_inverse=True)
+    CellOfSite = CellOfSite.reshape(-1)
+    # Order the sites by cell so each cell's sites are one slice
+    SiteOrder = np.argsort(CellOfSite, kind='stable')
+    CellStarts = np.searchsorted(CellOfSite[SiteOrder], np.arange(len(Keys) + 1))
+    CellCounts = np.diff(CellStarts)
+
+    # A point can reach at most two cells away, only half of the neighbourhood
+    # is looked up as each pair of cells only needs comparing once
+    CellIds = np.arange(len(Keys))
+    PairCells = []
+    PairOthers = []
+    for OffsetX in range(0, 3):
+        for OffsetY in range(-2, 3):
+            if OffsetX == 0 and OffsetY <= 0:
+                continue
+            Targets = Keys + OffsetX * Height + OffsetY
+            Positions = np.minimum(np.searchsorted(Keys, Targets), len(Keys) - 1)
+            Found = Keys[Positions] == Targets
+            PairCells.append(CellIds[Found])
+            PairOthers.append(Positions[Found])
+    PairCells = np.concatenate(PairCells)
+    PairOthers = np.concatenate(PairOthers)
+
+    parent = list(range(len(Keys)))
+
+    def find(CellId):
+        while parent[CellId] != CellId:
+            parent[CellId] = parent[parent[CellId]]
+            CellId = parent[CellId]
+        return CellId
+
+    def union(CellId, OtherId):
+        Root = find(CellId)
+        OtherRoot = find(OtherId)
+        if Root != OtherRoot:
+            parent[OtherRoot] = Root
+
+    # Compare every pair of points across the neighbouring cells, a bounded
+    # block of comparisons at a time, and link the cells with any pair in reach
+    LinkSquared = LinkDistance * LinkDistance
+    BlockLimit = 1000000
+    Comparisons = CellCounts[PairCells] * CellCounts[PairOthers]
+    Small = np.nonzero(Comparisons <= BlockLimit)[0]
+    Cumulative = np.cumsum(Comparisons[Small])
+    BlockStart = 0
+    while BlockStart < len(Small):
+        BlockEnd = max(BlockStart + 1, int(np.searchsorted(Cumulative, Cumulative[BlockStart] - Comparisons[Small[BlockStart]] + BlockLimit, side='right')))
+        Pairs = Small[BlockStart:BlockEnd]
+        Repeats = Comparisons[Pairs]
+        PairOfComparison = np.repeat(Pairs, Repeats)
+        Within = np.arange(Repeats.sum()) - np.repeat(np.cumsum(Repeats) - Repeats, Repeats)
+        OtherCounts = CellCounts[PairOthers[PairOfComparison]]
+        Points = SiteOrder[CellStarts[PairCells[PairOfComparison]] + Within // OtherCounts]
+        Others = SiteOrder[CellStarts[PairOthers[PairOfComparison]] + Within % OtherCounts]
+        Close = (xs[Points] - xs[Others]) ** 2 + (ys[Points] - ys[Others]) ** 2 <= LinkSquared
+        for Pair in np.unique(PairOfComparison[Close]).tolist():
+            union(PairCells[Pair], PairOthers[Pair])
+        BlockStart = BlockEnd
+
+    # Dense cell pairs are compared a block of points at a time, stopping at
+    # the first pair in reach
+    for Pair in np.nonzero(Comparisons > BlockLimit)[0].tolist():
+        CellId = PairCells[Pair]
+        OtherId = PairOthers[Pair]
+        if find(CellId) == find(OtherId):
+            continue
+        Members = SiteOrder[CellStarts[CellId]:CellStarts[CellId + 1]]
+        Others = SiteOrder[CellStarts[OtherId]:CellStarts[OtherId + 1]]
+        BlockSize = max(1, BlockLimit // len(Others))
+        for MemberStart in range(0, len(Members), BlockSize):
+            Block = Members[MemberStart:MemberStart + BlockSize]
+            SquaredDistances = (xs[Others][None, :] - xs[Block][:, None]) ** 2 + (ys[Others][None, :] - ys[Block][:, None]) ** 2
+            if np.any(SquaredDistances <= LinkSquared):
+                union(CellId, OtherId)
+                break
+    Roots = np.array([find(CellId) for CellId in range(len(Keys))], dtype=np.int64)
+    # Number the locations in the order their first point appears
+    LocationOfPoint = Roots[CellOfSite][SiteOfPoint]
+    FirstPoints = np.unique(LocationOfPoint, return_index=True)[1]
+    Numbering = np.empty(len(Keys), dtype=np.int64)
+    Numbering[LocationOfPoint[np.sort(FirstPoints)]] = np.arange(len(FirstPoints))
+    return Numbering[LocationOfPoint]
+
+def locationGeometries(Labels, xs, ys, Distance, LocationCount):
+    """
+    Returns the outline of each location as the union of the Distance
+    buffers around its points, buffering each distinct coordinate once.
+    """
+    Buffers = [[] for Location in range(LocationCount)]
+    Buffered = set()
+    for Label, x, y in zip(np.asarray(Labels).tolist(), np.asarray(xs).tolist(), np.asarray(ys).tolist()):
+        if (x, y) in Buffered:
+            continue
+        Buffered.add((x, y))
+        Buffers[Label].append(QgsGeometry.fromPointXY(QgsPointXY(x, y)).buffer(Distance, 5))
+    return [QgsGeometry.unaryUnion(Parts) for Parts in Buffers]
+
+def distinctPairs(Labels, Codes, CodeCount):
+    """
+    Returns the distinct pairs of a location label and an integer code as a
+    label array and a code array, ordered by label then code. Each pair is
+    packed into one integer key so they are found with a single flat sort.
+    """
+    CodeCount = max(CodeCount, 1)
+    Keys = np.unique(np.asarray(Labels, dtype=np.int64) * CodeCount + np.asarray(Codes, dtype=np.int64))
+    return (Keys // CodeCount).astype(np.int32), (Keys % CodeCount).astype(np.int32)
+
+def saveArchive(ArchivePath, **Arrays):
+    """
+    Writes arrays to a compressed NumPy archive, replacing any existing file
+    only once it is completely written. Each writer has a temporary file of
+    its own, so runs saving the same archive at once never share one.
+    """
+    Handle, TempPath = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(ArchivePath)), suffix='.tmp.npz')
+    try:
+        with os.fdopen(Handle, 'wb') as TempFile:
+            np.savez_compressed(TempFile, **Arrays)
+        os.replace(TempPath, ArchivePath)
+    except BaseException:
+        try:
+            os.remove(TempPath)
+        except OSError:
+            pass
+        raise
+
+class LocationState:
+    """
+    The locations found by a run, saved so that a later run over the same
+    spreadsheet with rows appended only has to place the new rows.
+    For every IP location inside the jurisdiction it holds the spreadsheet
+    row, projected coordinates and location. For every location it holds the
+    INCIDENTS count, the first spreadsheet row, the distinct customer codes
+    as (location, code) pairs and the outline. Locations are numbered in
+    the order of their first row, as clusterPoints numbers them, so an
+    updated state is the same as one built from the whole spreadsheet.
+    """
+
+    def __init__(self, Settings, RowCount, RowDigest, PointRows, PointXs, PointYs, PointLabels,
+                 Incidents, FirstRows, CustomerLabels, CustomerCodes, Outlines):
+        self.Settings = Settings
+        self.RowCount = RowCount
+        self.RowDigest = RowDigest
+        self.PointRows = PointRows
+        self.PointXs = PointXs
+        self.PointYs = PointYs
+        self.PointLabels = PointLabels
+        self.Incidents = Incidents
+        self.FirstRows = FirstRows
+        self.CustomerLabels = CustomerLabels
+        self.CustomerCodes = CustomerCodes
+        self.Outlines = Outlines
+
+    @property
+    def Identities(self):
+        """
+        The IDENTITIES count, distinct customers, of each location.
+        """
+        return np.bincount(self.CustomerLabels, minlength=len(self.Incidents))
+
+    @staticmethod
+    def digest(IPColumns, RowCount):
+        """
+        Returns a digest of the first RowCount rows of the spreadsheet columns.
+        """
+        Digest = hashlib.sha1()
+        for Column in [IPColumns.Lons, IPColumns.Lats] + [IPColumns.Codes[Name] for Name in IPLocationColumns.Columns]:
+            Digest.update(np.ascontiguousarray(Column[:RowCount]).tobytes())
+        return Digest.hexdigest()
+
+    @classmethod
+    def build(cls, Settings, IPColumns, PointRows, PointXs, PointYs, Distance):
+        """
+        Finds the locations of all the IP locations inside the jurisdiction.
+        """
+        Labels = clusterPoints(PointXs, PointYs, 2*Distance)
+        Outlines = locationGeometries(Labels, PointXs, PointYs, Distance, int(Labels.max()) + 1 if Labels.size else 0)
+        return cls.fromLabels(Settings, IPColumns, PointRows, PointXs, PointYs, Labels, Outlines)
+
+    @classmethod
+    def fromLabels(cls, Settings, IPColumns, PointRows, PointXs, PointYs, Labels, Outlines):
+        """
+        Makes the state of IP locations already placed into locations, such
+        as locations found separately in each zone, numbering the locations
+        in order of their first row.
+        """
+        Labels = np.asarray(Labels, dtype=np.int64)
+        LocationCount = len(Outlines)
+        FirstRows = np.full(LocationCount, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(FirstRows, Labels, PointRows)
+        Order = np.argsort(FirstRows, kind='stable')
+        Numbering = np.empty(LocationCount, dtype=np.int64)
+        Numbering[Order] = np.arange(LocationCount)
+        Labels = Numbering[Labels]
+        FirstRows = FirstRows[Order]
+        Outlines = [Outlines[Label] for Label in Order.tolist()]
+        Incidents = np.bincount(Labels, minlength=LocationCount)
+        CustomerLabels, CustomerCodes = distinctPairs(Labels, IPColumns.Codes['CUSTOMER N'][PointRows], len(IPColumns.Values['CUSTOMER N']))
+        return cls(Settings, len(IPColumns), cls.digest(IPColumns, len(IPColumns)), np.asarray(PointRows, dtype=np.int64),
+                   np.asarray(PointXs, dtype=float), np.asarray(PointYs, dtype=float), Labels,
+                   Incidents, FirstRows, CustomerLabels, CustomerCodes, Outlines)
+
+    def matches(self, Settings, IPColumns):
+        """
+        Returns True when this state was built with the same Settings from a
+        spreadsheet whose rows are still the first rows of IPColumns.
+        """
+        return (self.Settings == Settings and len(IPColumns) >= self.RowCount and
+                self.digest(IPColumns, self.RowCount) == self.RowDigest)
+
+    def extend(self, IPColumns, NewRows, NewXs, NewYs, Distance):
+        """
+        Adds the IP locations of the rows appended since the state was built.
+        Only existing points in the grid cells around the new points can be
+        in reach of them, so only those are clustered with the new points.
+        Locations the new points join are merged from their stored counts,
+        customers and outlines, and every other location is left as it was.
+        """
+        LinkDistance = 2*Distance
+        NewRows = np.asarray(NewRows, dtype=np.int64)
+        NewXs = np.asarray(NewXs, dtype=float)
+        NewYs = np.asarray(NewYs, dtype=float)
+        self.RowDigest = self.digest(IPColumns, len(IPColumns))
+        self.RowCount = len(IPColumns)
+        if NewRows.size == 0:
+            return
+
+        def cellKeys(xs, ys):
+            return np.floor(xs / LinkDistance).astype(np.int64) * 4294967296 + np.floor(ys / LinkDistance).astype(np.int64)
+
+        NewKeys = np.unique(cellKeys(NewXs, NewYs))
+        ReachKeys = np.unique((NewKeys[:, None] + np.array([OffsetX * 4294967296 + OffsetY for OffsetX in (-1, 0, 1) for OffsetY in (-1, 0, 1)])[None, :]).reshape(-1))
+        NearPoints = np.nonzero(np.isin(cellKeys(self.PointXs, self.PointYs), ReachKeys))[0]
+        LocalLabels = clusterPoints(np.concatenate((self.PointXs[NearPoints], NewXs)), np.concatenate((self.PointYs[NearPoints], NewYs)), LinkDistance)
+        OldLocalLabels = LocalLabels[:len(NearPoints)]
+        NewLocalLabels = LocalLabels[len(NearPoints):]
+
+        # Local groups join the existing locations their points belong to. A
+        # location's nearby points can fall in several groups, so groups and
+        # locations are merged with union-find, keeping the lowest number
+        OldCount = len(self.Incidents)
+        GroupCount = int(LocalLabels.max()) + 1
+        parent = {}
+
+        def find(Node):
+            parent.setdefault(Node, Node)
+            while parent[Node] != Node:
+                parent[Node] = parent[parent[Node]]
+                Node = parent[Node]
+            return Node
+
+        Links = np.unique(np.column_stack((self.PointLabels[NearPoints], OldCount + OldLocalLabels)).reshape(-1, 2), axis=0)
+        for Label, Group in Links.tolist():
+            Root = find(Label)
+            GroupRoot = find(Group)
+            if Root != GroupRoot:
+                parent[max(Root, GroupRoot)] = min(Root, GroupRoot)
+        GroupTargets = np.array([find(OldCount + Group) for Group in range(GroupCount)], dtype=np.int64)
+        NewGroups = GroupTargets >= OldCount
+        GroupTargets[NewGroups] = OldCount + np.arange(int(NewGroups.sum()))
+        LocationCount = OldCount + int(NewGroups.sum())
+        Remap = np.arange(LocationCount)
+        for Label in np.unique(Links[:, 0]).tolist():
+            Remap[Label] = find(Label)
+        NewLabels = GroupTargets[NewLocalLabels]
+
+        # Merge the stored aggregates into their new locations and add the new points
+        Incidents = np.zeros(LocationCount, dtype=np.int64)
+        np.add.at(Incidents, Remap[:OldCount], self.Incidents)
+        np.add.at(Incidents, NewLabels, 1)
+        FirstRows = np.full(LocationCount, np.iinfo(np.int64).max, dtype=np.int64)
+        np.minimum.at(FirstRows, Remap[:OldCount], self.FirstRows)
+        np.minimum.at(FirstRows, NewLabels, NewRows)
+        CodeCount = len(IPColumns.Values['CUSTOMER N'])
+        CustomerLabels, CustomerCodes = distinctPairs(np.concatenate((Remap[self.CustomerLabels], NewLabels)),
+                                                      np.concatenate((self.CustomerCodes, IPColumns.Codes['CUSTOMER N'][NewRows])), CodeCount)
+
+        # Redraw only the outlines of the locations that gained points
+        Outlines = list(self.Outlines) + [None] * (LocationCount - OldCount)
+        Parts = {Target: [] for Target in np.unique(NewLabels).tolist()}
+        for Label, Target in enumerate(Remap[:OldCount].tolist()):
+            if Target in Parts:
+                Parts[Target].append(self.Outlines[Label])
+        for Label, NewOutline in zip(np.unique(NewLabels).tolist(), locationGeometries(np.unique(NewLabels, return_inverse=True)[1].reshape(-1), NewXs, NewYs, Distance, len(Parts))):
+            Parts[Label].append(NewOutline)
+        for Target, TargetParts in Parts.items():
+            Outlines[Target] = QgsGeometry.unaryUnion(TargetParts)
+
+        # Renumber the remaining locations in order of their first row
+        Kept = np.unique(np.concatenate((Remap[:OldCount], NewLabels)))
+        Kept = Kept[np.argsort(FirstRows[Kept], kind='stable')]
+        Numbering = np.empty(LocationCount, dtype=np.int64)
+        Numbering[Kept] = np.arange(len(Kept))
+        self.PointRows = np.concatenate((self.PointRows, NewRows))
+        self.PointXs = np.concatenate((self.PointXs, NewXs))
+        self.PointYs = np.concatenate((self.PointYs, NewYs))
+        self.PointLabels = Numbering[np.concatenate((Remap[self.PointLabels], NewLabels))]
+        self.Incidents = Incidents[Kept]
+        self.FirstRows = FirstRows[Kept]
+        self.CustomerLabels, self.CustomerCodes = distinctPairs(Numbering[CustomerLabels], CustomerCodes, CodeCount)
+        self.Outlines = [Outlines[Label] for Label in Kept.tolist()]
+
+    def save(self, StatePath):
+        """
+        Writes the state to a NumPy archive, with the outlines as WKB.
+        """
+        Wkbs = [np.frombuffer(bytes(Outline.asWkb()), dtype=np.uint8) for Outline in self.Outlines]
+        saveArchive(StatePath, Settings=np.array(json.dumps(self.Settings, sort_keys=True)),
+                            RowCount=self.RowCount, RowDigest=np.array(self.RowDigest),
+                            PointRows=self.PointRows, PointXs=self.PointXs, PointYs=self.PointYs, PointLabels=self.PointLabels,
+                            Incidents=self.Incidents, FirstRows=self.FirstRows,
+                            CustomerLabels=self.CustomerLabels, CustomerCodes=self.CustomerCodes,
+                            OutlineWkb=np.concatenate(Wkbs) if Wkbs else np.zeros(0, dtype=np.uint8),
+                            OutlineEnds=np.cumsum([len(Wkb) for Wkb in Wkbs], dtype=np.int64))
+
+    @classmethod
+    def load(cls, StatePath):
+        """
+        Reads a state written by save.
+        """
+        with np.load(StatePath, allow_pickle=False) as Archive:
+            OutlineWkb = Archive['OutlineWkb'].tobytes()
+            OutlineEnds = Archive['OutlineEnds'].tolist()
+            Outlines = []
+            for Start, End in zip([0] + OutlineEnds[:-1], OutlineEnds):
+                Outline = QgsGeometry()
+                Outline.fromWkb(OutlineWkb[Start:End])
+                Outlines.append(Outline)
+            return cls(json.loads(str(Archive['Settings'])), int(Archive['RowCount']), str(Archive['RowDigest']),
+                       Archive['PointRows'], Archive['PointXs'], Archive['PointYs'], Archive['PointLabels'],
+                       Archive['Incidents'], Archive['FirstRows'], Archive['CustomerLabels'], Archive['CustomerCodes'], Outlines)
+
+def transformCoordinates(xs, ys, Transform):
+    """
+    Transforms arrays of x and y coordinates in a single call by carrying
+    them as the vertices of one line string, and reads the results straight
+    back from its WKB. Any point that cannot be transformed becomes NaN.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if xs.size == 0:
+        return xs.copy(), ys.copy()
+    Line = QgsLineString(xs.tolist(), ys.tolist())
+    try:
+        Line.transform(Transform)
+    except QgsCsException:
+        # Fall back to one point at a time to find the points that fail
+        TransformedXs = np.full(xs.size, np.nan)
+        TransformedYs = np.full(ys.size, np.nan)
+        for Row, (x, y) in enumerate(zip(xs.tolist(), ys.tolist())):
+            try:
+                Point = Transform.transform(QgsPointXY(x, y))
+            except QgsCsException:
+                continue
+            TransformedXs[Row] = Point.x()
+            TransformedYs[Row] = Point.y()
+        return TransformedXs, TransformedYs
+    Wkb = bytes(Line.asWkb())
+    # Skip the byte order, geometry type and point count at the start of the WKB
+    Coordinates = np.frombuffer(Wkb, dtype='<f8' if Wkb[0] == 1 else '>f8', offset=9).reshape(-1, 2)
+    return Coordinates[:, 0].copy(), Coordinates[:, 1].copy()
+
+def pointsInside(xs, ys, Area):
+    """
+    Returns a boolean array marking the points that intersect the Area
+    geometry. Points outside the bounding box of Area are dropped with array
+    comparisons before the rest are tested against the prepared Area.
+    """
+    Box = Area.boundingBox()
+    Candidates = np.nonzero(np.isfinite(xs) & np.isfinite(ys) &
+                            (xs >= Box.xMinimum()) & (xs <= Box.xMaximum()) &
+                            (ys >= Box.yMinimum()) & (ys <= Box.yMaximum()))[0]
+    Inside = np.zeros(len(xs), dtype=bool)
+    if Candidates.size == 0:
+        return Inside
+    Engine = QgsGeometry.createGeometryEngine(Area.constGet())
+    Engine.prepareGeometry()
+    Inside[Candidates] = np.fromiter((Engine.intersects(QgsPoint(x, y)) for x, y in zip(xs[Candidates].tolist(), ys[Candidates].tolist())),
+                                     dtype=bool, count=len(Candidates))
+    return Inside
+
+def projectAndClip(Lons, Lats, Transform, Boundary):
+    """
+    Transforms longitude and latitude arrays with Transform and keeps the
+    points that intersect the Boundary geometry. Returns the projected x and
+    y of the kept points and their row numbers in the input arrays.
+    """
+    Rows = np.nonzero(np.isfinite(Lons) & np.isfinite(Lats))[0]
+    xs, ys = transformCoordinates(Lons[Rows], Lats[Rows], Transform)
+    Kept = np.nonzero(pointsInside(xs, ys, Boundary))[0]
+    return xs[Kept], ys[Kept], Rows[Kept]
+
+class StationLookup:
+    """
+    Assigns a police station to each of a batch of points. A point inside a
+    police area of responsibility gets the station of that area and a point
+    outside every area gets the nearest station. The distance returned is
+    to the station point when station points are given, and otherwise to
+    the area, 0 inside it. A point inside an area whose station has no
+    station point of the same name has no distance, rather than the distance
+    to some other station. The areas and station points are taken from their
+    reference layers, so no polygon overlay is computed.
+    """
+
+    # Points compared against every station point at once
+    BlockSize = 4096
+
+    def __init__(self, AORReference, AORField, StationReference=None, StationField=None):
+        self.AORReference = AORReference
+        self.AreaNames = AORReference.attribute(AORField)
+        self.AreaIds = sorted(self.AreaNames)
+        self.StationNames = []
+        StationPoints = []
+        if StationReference is not None:
+            Names = StationReference.attribute(StationField)
+            for StationId in sorted(Names):
+                Station = StationReference.Index.geometry(StationId)
+                if not Station.isEmpty():
+                    self.StationNames.append(Names[StationId])
+                    StationPoints.append(Station.centroid().asPoint())
+        self.StationXs = np.array([Point.x() for Point in StationPoints], dtype=float)
+        self.StationYs = np.array([Point.y() for Point in StationPoints], dtype=float)
+        # The first station point of each name, for the distance to the station of an area
+        self.StationByName = {}
+        for StationIndex, Name in enumerate(self.StationNames):
+            if self.nameKey(Name) is not None:
+                self.StationByName.setdefault(self.nameKey(Name), StationIndex)
+
+    @staticmethod
+    def nameKey(Name):
+        """
+        Returns a station name in the form area and station names are matched
+        in, ignoring case and spacing, or None for a missing name.
+        """
+        if Name is None or Name == NULL:
+            return None
+        return ' '.join(str(Name).split()).casefold()
+
+    def nearestStations(self, xs, ys):
+        """
+        Returns the index of the nearest station point to each point and the
+        distance to it, comparing a block of points with every station at once.
+        """
+        Nearest = np.zeros(len(xs), dtype=np.int64)
+        Distances = np.zeros(len(xs))
+        for Start in range(0, len(xs), self.BlockSize):
+            Block = slice(Start, Start + self.BlockSize)
+            Squared = (xs[Block, None] - self.StationXs[None, :])**2 + (ys[Block, None] - self.StationYs[None, :])**2
+            Nearest[Block] = np.argmin(Squared, axis=1)
+            Distances[Block] = np.sqrt(Squared[np.arange(Squared.shape[0]), Nearest[Block]])
+        return Nearest, Distances
+
+    def assign(self, xs, ys):
+        """
+        Returns the station name of each point, None when there are no areas
+        or stations to choose from, and the distance to it.
+        """
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        Names = np.full(len(xs), None, dtype=object)
+        Distances = np.full(len(xs), np.nan)
+        Areas = np.full(len(xs), -1, dtype=np.int64)
+        for AreaIndex, AreaId in enumerate(self.AreaIds):
+            Unassigned = np.nonzero(Areas < 0)[0]
+            Inside = pointsInside(xs[Unassigned], ys[Unassigned], self.AORReference.Index.geometry(AreaId))
+            Areas[Unassigned[Inside]] = AreaIndex
+        Contained = np.nonzero(Areas >= 0)[0]
+        Names[Contained] = [self.AreaNames[self.AreaIds[AreaIndex]] for AreaIndex in Areas[Contained].tolist()]
+        Outside = np.nonzero(Areas < 0)[0]
+        if self.StationNames:
+            Nearest, NearestDistances = self.nearestStations(xs[Outside], ys[Outside])
+            Names[Outside] = [self.StationNames[StationIndex] for StationIndex in Nearest.tolist()]
+            Distances[Outside] = NearestDistances
+            # Points inside an area are measured to the station of that area when it has a point
+            for Point in Contained.tolist():
+                StationIndex = self.StationByName.get(self.nameKey(Names[Point]))
+                if StationIndex is not None:
+                    Distances[Point] = np.hypot(xs[Point] - self.StationXs[StationIndex], ys[Point] - self.StationYs[StationIndex])
+        else:
+            Distances[Contained] = 0.0
+            for Point in Outside.tolist():
+                Location = QgsGeometry.fromPointXY(QgsPointXY(xs[Point], ys[Point]))
+                for AreaId in self.AORReference.Index.nearestNeighbor(Location, 1):
+                    Names[Point] = self.AreaNames[AreaId]
+                    Distances[Point] = self.AORReference.Index.geometry(AreaId).distance(Location)
+                    break
+        return Names, Distances
+
+def utmZones(Lons, Lats):
+    """
+    Returns the UTM zone, 1 to 60, of each longitude and whether each point
+    is south of the equator.
+    """
+    Zones = np.floor((np.asarray(Lons, dtype=float) + 180.0) / 6.0).astype(np.int64) % 60 + 1
+    return Zones, np.asarray(Lats, dtype=float) < 0
+
+def zoneCrs(Zone, South, crs):
+    """
+    Returns the authority id of the projected coordinate system of a UTM
+    zone. Zones of the Australian MGA grids keep the GDA2020 or GDA94 datum
+    when crs is on that datum, and every other zone is on WGS 84.
+    """
+    AuthId = crs.authid()
+    if South and 7846 <= 7800 + Zone <= 7859 and AuthId in ['EPSG:7844'] + ['EPSG:{}'.format(Code) for Code in range(7846, 7860)]:
+        return 'EPSG:{}'.format(7800 + Zone)
+    if South and 28348 <= 28300 + Zone <= 28358 and AuthId in ['EPSG:4283'] + ['EPSG:{}'.format(Code) for Code in range(28348, 28359)]:
+        return 'EPSG:{}'.format(28300 + Zone)
+    return 'EPSG:{}'.format((32700 if South else 32600) + Zone)
+
+def crsDefinition(crs):
+    """
+    Returns a string a worker process can recreate crs from.
+    """
+    return crs.authid() or 'WKT:' + crs.toWkt()
+
+def startWorker(PrefixPath):
+    """
+    Starts QGIS without its interface in a worker process.
+    """
+    global WorkerApplication
+    QgsApplication.setPrefixPath(PrefixPath, True)
+    WorkerApplication = QgsApplication([], False)
+    WorkerApplication.initQgis()
+
+def pythonExecutable():
+    """
+    Returns the Python interpreter to start worker processes with, or None.
+    QGIS embeds Python, so sys.executable is often QGIS itself and the
+    interpreter has to be found beside it.
+    """
+    if os.path.basename(sys.executable).lower().startswith('python'):
+        return sys.executable
+    for Candidate in [os.path.join(sys.exec_prefix, 'python.exe'), os.path.join(sys.exec_prefix, 'bin', 'python3'),
+                      shutil.which('python3'), shutil.which('python')]:
+        if Candidate and os.path.isfile(Candidate):
+            return Candidate
+    return None
+
+def runPartitions(Function, Tasks, feedback):
+    """
+    Runs Function on every task and returns the results in task order. Tasks
+    run in a pool of worker processes, one per core, when there is more than
+    one task and an interpreter to start them with, and in this process in
+    turn otherwise or when the workers cannot be started.
+    """
+    Executable = pythonExecutable()
+    ModulePath = globals().get('__file__')
+    if len(Tasks) > 1 and (os.cpu_count() or 1) > 1 and Executable and ModulePath:
+        # Workers import this script by its module name from its directory, so
+        # make sure pickle finds the running module under that name
+        if os.path.dirname(os.path.abspath(ModulePath)) not in sys.path:
+            sys.path.append(os.path.dirname(os.path.abspath(ModulePath)))
+        if getattr(sys.modules.get(__name__), Function.__name__, None) is not Function:
+            Module = types.ModuleType(__name__)
+            Module.__dict__.update(globals())
+            sys.modules[__name__] = Module
+        try:
+            Context = multiprocessing.get_context('spawn')
+            Context.set_executable(Executable)
+            with concurrent.futures.ProcessPoolExecutor(max_workers=min(len(Tasks), os.cpu_count()), mp_context=Context,
+                                                        initializer=startWorker, initargs=(QgsApplication.prefixPath(),)) as Pool:
+                Futures = [Pool.submit(Function, Task) for Task in Tasks]
+                Results = []
+                for Future in Futures:
+                    if feedback.isCanceled():
+                        for Pending in Futures:
+                            Pending.cancel()
+                        raise QgsProcessingException('The run was canceled')
+                    Results.append(Future.result())
+                    feedback.setProgress(100.0 * len(Results) / len(Tasks))
+                return Results
+        except (OSError, ImportError, pickle.PicklingError, concurrent.futures.BrokenExecutor) as Error:
+            feedback.pushInfo('Worker processes could not be started ({}), processing the partitions in turn'.format(Error))
+    Results = []
+    for Task in Tasks:
+        if feedback.isCanceled():
+            raise QgsProcessingException('The run was canceled')
+        Results.append(Function(Task))
+        feedback.setProgress(100.0 * len(Results) / len(Tasks))
+    return Results
+
+def locateZone(Task):
+    """
+    Finds the locations of the points of one zone and its halo, the points
+    of neighbouring zones within reach of it, buffering them in metres in
+    the projected coordinate system of the zone. Returns the labels of all
+    the points and, as WKB in the output coordinate system, the outline of
+    each location drawn from the zone's own points only. Runs in worker
+    processes, so it takes and returns only plain values.
+    """
+    Lons, Lats, OwnCount, ZoneDefinition, OutputDefinition, Distance = Task
+    ZoneSys = QgsCoordinateReferenceSystem(ZoneDefinition)
+    xs, ys = transformCoordinates(Lons, Lats, QgsCoordinateTransform(QgsCoordinateReferenceSystem('EPSG:4326'), ZoneSys, QgsProject.instance()))
+    Labels = clusterPoints(xs, ys, 2*Distance)
+    Outlines = locationGeometries(Labels[:OwnCount], xs[:OwnCount], ys[:OwnCount], Distance, int(Labels.max()) + 1 if Labels.size else 0)
+    ToOutput = QgsCoordinateTransform(ZoneSys, QgsCoordinateReferenceSystem(OutputDefinition), QgsProject.instance())
+    Wkbs = []
+    for Outline in Outlines:
+        Outline.transform(ToOutput)
+        Wkbs.append(bytes(Outline.asWkb()))
+    return Labels, Wkbs
+
+def locateByZone(Lons, Lats, crs, Distance, feedback):
+    """
+    Finds the locations of points spread over several UTM zones. The points
+    are partitioned by zone and each zone is processed in its own projected
+    coordinate system by runPartitions, together with a halo of the points
+    of neighbouring zones within the link distance, 2 x Distance, of it.
+    Locations crossing a zone edge share halo points and are stitched
+    together by stitchPartitions, as the tiles of locateByTile are. Returns
+    the labels of the points, numbered across all zones, and the outlines
+    in crs.
+    """
+    Lons = np.asarray(Lons, dtype=float)
+    Lats = np.asarray(Lats, dtype=float)
+    if len(Lons) == 0:
+        return np.zeros(0, dtype=np.int64), []
+    Zones, South = utmZones(Lons, Lats)
+    Keys = Zones * 2 + South
+    # The link distance in degrees at each point, widened by half so no point in reach is missed
+    ReachLats = 1.5 * 2*Distance / 110574.0
+    ReachLons = 1.5 * 2*Distance / (111320.0 * np.cos(np.radians(np.minimum(np.abs(Lats) + ReachLats, 89.0))))
+    Partitions = []
+    Tasks = []
+    for Key in np.unique(Keys).tolist():
+        Zone = Key // 2
+        IsSouth = bool(Key % 2)
+        Own = np.nonzero(Keys == Key)[0]
+        # Degrees east of the zone's central meridian, wrapped across the antimeridian
+        FromMeridian = (Lons - (6 * Zone - 183) + 180.0) % 360.0 - 180.0
+        Near = (np.abs(FromMeridian) <= 3.0 + ReachLons) & ((Lats < ReachLats) if IsSouth else (Lats >= -ReachLats))
+        Points = np.concatenate((Own, np.nonzero(Near & (Keys != Key))[0]))
+        Partitions.append((Points, len(Own)))
+        Tasks.append((Lons[Points], Lats[Points], len(Own), zoneCrs(Zone, IsSouth, crs), crsDefinition(crs), Distance))
+    feedback.pushInfo('Locating {} IP locations in {} zones: {}'.format(len(Lons), len(Tasks), ', '.join(Task[3] for Task in Tasks)))
+    return stitchPartitions(Partitions, runPartitions(locateZone, Tasks, feedback), len(Lons))
+
+def connectedComponents(EdgeStarts, EdgeEnds, NodeCount):
+    """
+    Returns the root of every node, the lowest node of the component the
+    edges join it into. All the edges are hooked onto the lower root and
+    the parents compressed with array operations until nothing changes.
+    """
+    Parents = np.arange(NodeCount)
+    EdgeStarts = np.asarray(EdgeStarts, dtype=np.int64)
+    EdgeEnds = np.asarray(EdgeEnds, dtype=np.int64)
+    while True:
+        StartRoots = Parents[EdgeStarts]
+        EndRoots = Parents[EdgeEnds]
+        Joined = StartRoots != EndRoots
+        if not Joined.any():
+            return Parents
+        np.minimum.at(Parents, np.maximum(StartRoots, EndRoots)[Joined], np.minimum(StartRoots, EndRoots)[Joined])
+        while True:
+            Grandparents = Parents[Parents]
+            if np.array_equal(Grandparents, Parents):
+                break
+            Parents = Grandparents
+
+def locateTile(Task):
+    """
+    Finds the locations of the points of one tile and its halo, the points
+    of neighbouring tiles within reach of it. Returns the labels of all the
+    points and, as WKB, the outline of each location drawn from the tile's
+    own points only. Runs in worker processes, so it takes and returns only
+    plain values.
+    """
+    xs, ys, OwnCount, Distance = Task
+    Labels = clusterPoints(xs, ys, 2*Distance)
+    Outlines = locationGeometries(Labels[:OwnCount], xs[:OwnCount], ys[:OwnCount], Distance, int(Labels.max()) + 1 if Labels.size else 0)
+    return Labels, [bytes(Outline.asWkb()) for Outline in Outlines]
+
+def locateByTile(xs, ys, Distance, TileSize, feedback):
+    """
+    Finds the locations of a very large set of points one grid tile at a
+    time, so each worker only holds the points of its tile. Each tile is
+    clustered together with a halo of the neighbouring points within the
+    link distance, 2 x Distance, of it, so every link from the tile's own
+    points is seen in that tile. Locations crossing tile edges share halo
+    points and are stitched together with connectedComponents, giving the
+    same locations as clustering every point at once; their outlines are
+    the union of the parts drawn in each tile. Returns the labels of the
+    points and the outlines.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    PointCount = len(xs)
+    if PointCount == 0:
+        return np.zeros(0, dtype=np.int64), []
+    LinkDistance = 2*Distance
+    # A halo never reaches past the neighbouring tiles
+    TileSize = max(float(TileSize), 2*LinkDistance)
+    OriginX = xs.min()
+    OriginY = ys.min()
+    TileXs = np.floor((xs - OriginX) / TileSize).astype(np.int64)
+    TileYs = np.floor((ys - OriginY) / TileSize).astype(np.int64)
+    Columns = int(TileXs.max()) + 3
+
+    # Each point belongs to its own tile and to the halo of every neighbouring tile it is within reach of
+    Keys = [(TileYs + 1) * Columns + TileXs + 1]
+    Members = [np.arange(PointCount)]
+    Halo = [np.zeros(PointCount, dtype=bool)]
+    for OffsetX in (-1, 0, 1):
+        for OffsetY in (-1, 0, 1):
+            if OffsetX == 0 and OffsetY == 0:
+                continue
+            NeighbourXs = TileXs + OffsetX
+            NeighbourYs = TileYs + OffsetY
+            Near = np.nonzero((xs >= OriginX + NeighbourXs * TileSize - LinkDistance) & (xs < OriginX + (NeighbourXs + 1) * TileSize + LinkDistance) &
+                              (ys >= OriginY + NeighbourYs * TileSize - LinkDistance) & (ys < OriginY + (NeighbourYs + 1) * TileSize + LinkDistance))[0]
+            Keys.append((NeighbourYs[Near] + 1) * Columns + NeighbourXs[Near] + 1)
+            Members.append(Near)
+            Halo.append(np.ones(len(Near), dtype=bool))
+    Keys = np.concatenate(Keys)
+    Members = np.concatenate(Members)
+    Halo = np.concatenate(Halo)
+
+    # Group the points by tile with each tile's own points first, tiles with only halo points have nothing to find
+    Order = np.lexsort((Halo, Keys))
+    Keys = Keys[Order]
+    Members = Members[Order]
+    Halo = Halo[Order]
+    Starts = np.flatnonzero(np.r_[True, Keys[1:] != Keys[:-1]])
+    Tiles = []
+    Tasks = []
+    for Start, End in zip(Starts.tolist(), np.r_[Starts[1:], len(Keys)].tolist()):
+        OwnCount = int(np.count_nonzero(~Halo[Start:End]))
+        if OwnCount:
+            Tiles.append((Members[Start:End], OwnCount))
+            Tasks.append((xs[Members[Start:End]], ys[Members[Start:End]], OwnCount, Distance))
+    feedback.pushInfo('Locating {} IP locations in {} tiles of {:.0f}m'.format(PointCount, len(Tasks), TileSize))
+    return stitchPartitions(Tiles, runPartitions(locateTile, Tasks, feedback), PointCount)
+
+def stitchPartitions(Partitions, Results, PointCount):
+    """
+    Joins the locations found separately in partitions of the points that
+    overlap by their halos. Each partition is the point numbers it holds,
+    its own points first, and the count of its own points. Each result is
+    the labels of those points and, as WKB, the outlines drawn from the
+    partition's own points. Locations sharing a point are joined with
+    connectedComponents and their outlines are the union of their parts.
+    Returns the labels of the points and the outlines.
+    """
+    # Join every point to the first point of its location in each partition it was clustered in
+    Firsts = []
+    for (Points, OwnCount), (PartitionLabels, Wkbs) in zip(Partitions, Results):
+        First = np.full(len(Wkbs), PointCount, dtype=np.int64)
+        np.minimum.at(First, PartitionLabels, Points)
+        Firsts.append(First)
+    Roots = connectedComponents(np.concatenate([Points for Points, OwnCount in Partitions]),
+                                np.concatenate([First[PartitionLabels] for First, (PartitionLabels, Wkbs) in zip(Firsts, Results)]), PointCount)
+    RootIds, Labels = np.unique(Roots, return_inverse=True)
+
+    # Put together the outline of each location from the parts drawn in the partitions holding its points
+    Parts = [[] for Root in RootIds]
+    for (Points, OwnCount), (PartitionLabels, Wkbs), First in zip(Partitions, Results, Firsts):
+        for PartitionLabel in np.unique(PartitionLabels[:OwnCount]).tolist():
+            Outline = QgsGeometry()
+            Outline.fromWkb(Wkbs[PartitionLabel])
+            Parts[Labels[First[PartitionLabel]]].append(Outline)
+    return Labels.reshape(-1), [LocationParts[0] if len(LocationParts) == 1 else QgsGeometry.unaryUnion(LocationParts) for LocationParts in Parts]
+
+#the caches are kept in this directory instead of the QGIS profile when it is set, as the benchmark does
+CacheRoot = None
+
+def cacheDirectory(*SubFolders):
+    """
+    Returns the directory the tool keeps its caches in, under the QGIS
+    profile so it is shared between projects and analysis directories.
+    """
+    Directory = os.path.join(CacheRoot or os.path.join(QgsApplication.qgisSettingsDirPath(), 'VPCPSLOITool'), *SubFolders)
+    os.makedirs(Directory, exist_ok=True)
+    return Directory
+
+def fileDigest(FilePath, BlockSize=1048576):
+    """
+    Returns the SHA-1 hex digest of a file's contents, read a block at a time.
+    """
+    Digest = hashlib.sha1()
+    with open(FilePath, 'rb') as File:
+        for Block in iter(lambda: File.read(BlockSize), b''):
+            Digest.update(Block)
+    return Digest.hexdigest()
+
+class IPLocationColumns:
+    """
+    A columnar copy of the IP locations spreadsheet. The IP LON and IP LAT
+    coordinates are float arrays and the CUSTOMER I, CUSTOMER N and IP ADDRESS
+    fields are dictionary encoded, each row holding an integer code into the
+    list of distinct values of that field. Customers are compared by these
+    codes and their values are only looked up for the rows that are output.
+    """
+
+    # The encoded fields, named as they appear in the output reports
+    Columns = ['CUSTOMER I', 'CUSTOMER N', 'IP ADDRESS']
+
+    def __init__(self, Lons, Lats, Codes, Values):
+        self.Lons = Lons
+        self.Lats = Lats
+        self.Codes = Codes
+        self.Values = Values
+        self.Customers = None
+
+    def __len__(self):
+        return len(self.Lons)
+
+    @classmethod
+    def fromSource(cls, source, FieldNames, ChunkSize=50000):
+        """
+        Reads the coordinate and encoded fields from a feature source without
+        geometry. Rows are converted to arrays a chunk at a time so only one
+        chunk of Python values is held while reading very large extracts.
+        """
+        ReadFields = [FieldNames['IP LON'], FieldNames['IP LAT']] + [FieldNames[Column] for Column in cls.Columns]
+        request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes(ReadFields, source.fields())
+        Lookups = {Column: {} for Column in cls.Columns}
+        Values = {Column: [] for Column in cls.Columns}
+        LonChunks = []
+        LatChunks = []
+        CodeChunks = {Column: [] for Column in cls.Columns}
+
+        def coordinate(Value):
+            try:
+                return float(Value)
+            except (TypeError, ValueError):
+                return np.nan
+
+        def flush(Rows):
+            LonChunks.append(np.array([coordinate(Row[0]) for Row in Rows], dtype=float))
+            LatChunks.append(np.array([coordinate(Row[1]) for Row in Rows], dtype=float))
+            for ColumnIndex, Column in enumerate(cls.Columns):
+                Lookup = Lookups[Column]
+                ColumnValues = Values[Column]
+                Codes = np.empty(len(Rows), dtype=np.int32)
+                for RowIndex, Row in enumerate(Rows):
+                    Value = Row[ColumnIndex + 2]
+                    Value = None if Value == NULL else Value
+                    Code = Lookup.get(Value)
+                    if Code is None:
+                        Code = Lookup[Value] = len(ColumnValues)
+                        ColumnValues.append(Value)
+                    Codes[RowIndex] = Code
+                CodeChunks[Column].append(Codes)
+
+        Rows = []
+        for Row in source.getFeatures(request):
+            Rows.append([Row[FieldName] for FieldName in ReadFields])
+            if len(Rows) == ChunkSize:
+                flush(Rows)
+                Rows = []
+        flush(Rows)
+        Codes = {Column: np.concatenate(CodeChunks[Column]) for Column in cls.Columns}
+        return cls(np.concatenate(LonChunks), np.concatenate(LatChunks), Codes, Values)
+
+    def save(self, CachePath):
+        """
+        Writes the columns to a compressed NumPy archive, replacing any
+        existing cache file only once it is completely written.
+        """
+        saveArchive(CachePath, Lons=self.Lons, Lats=self.Lats,
+                    Values=np.array(json.dumps(self.Values, default=str)),
+                    **{'Codes_' + str(ColumnIndex): self.Codes[Column] for ColumnIndex, Column in enumerate(self.Columns)})
+
+    @classmethod
+    def load(cls, CachePath):
+        """
+        Reads columns written by save.
+        """
+        with np.load(CachePath, allow_pickle=False) as Archive:
+            Codes = {Column: Archive['Codes_' + str(ColumnIndex)] for ColumnIndex, Column in enumerate(cls.Columns)}
+            return cls(Archive['Lons'], Archive['Lats'], Codes, json.loads(str(Archive['Values'])))
+
+    def customers(self):
+        """
+        Returns an integer code for the customer of every row, numbering the
+        distinct pairs of CUSTOMER I and CUSTOMER N codes, and the number of
+        distinct customers.
+        """
+        if self.Customers is None:
+            Keys = self.Codes['CUSTOMER I'].astype(np.int64) * max(len(self.Values['CUSTOMER N']), 1) + self.Codes['CUSTOMER N']
+            Distinct, Customers = np.unique(Keys, return_inverse=True)
+            self.Customers = (Customers.reshape(-1).astype(np.int32), len(Distinct))
+        return self.Customers
+
+    def decode(self, Column, Row):
+        """
+        Returns the original value of an encoded field for one row.
+        """
+        return self.Values[Column][self.Codes[Column][Row]]
+
+def readIPLocations(source, SourceString, FieldNames, CacheDirectory):
+    """
+    Returns the IPLocationColumns of the spreadsheet, from the cache when
+    the same file has been read before. The cache is keyed by the hash and
+    modified time of the file together with the layer and field names read,
+    so a changed spreadsheet is always read again. Only the latest entry of
+    each spreadsheet is kept, and entries that have not been used for
+    ReferenceCache.MaxAgeDays are deleted, like the reference cache.
+    """
+    SourcePath = SourceString.split('|')[0]
+    if not os.path.isfile(SourcePath):
+        return IPLocationColumns.fromSource(source, FieldNames)
+    SourceKey = hashlib.sha1('|'.join([os.path.normcase(os.path.realpath(SourcePath)), SourceString,
+                                       json.dumps(FieldNames, sort_keys=True)]).encode('utf-8')).hexdigest()
+    ContentKey = hashlib.sha1('|'.join([fileDigest(SourcePath), str(os.stat(SourcePath).st_mtime_ns)]).encode('utf-8')).hexdigest()
+    CachePath = os.path.join(CacheDirectory, SourceKey + '_' + ContentKey + '.npz')
+    Now = time.time()
+    for CachedFile in glob.glob(os.path.join(CacheDirectory, '*.npz')):
+        if CachedFile == CachePath:
+            continue
+        Replaced = os.path.basename(CachedFile).startswith(SourceKey + '_')
+        try:
+            if Replaced or Now - os.stat(CachedFile).st_mtime > ReferenceCache.MaxAgeDays * 86400:
+                os.remove(CachedFile)
+        except OSError:
+            pass
+    if os.path.isfile(CachePath):
+        Columns = IPLocationColumns.load(CachePath)
+        # The modified time of an entry records when it was last used
+        os.utime(CachePath)
+        return Columns
+    Columns = IPLocationColumns.fromSource(source, FieldNames)
+    try:
+        Columns.save(CachePath)
+    except OSError:
+        # Another run reading the same spreadsheet may have written the entry first, which it is then left to
+        if not os.path.isfile(CachePath):
+            raise
+    return Columns
+
+class ReferenceLayer:
+    """
+    A reference layer reprojected to the project coordinate system, with a
+    spatial index over its features that also holds their geometries.
+    """
+
+    def __init__(self, Source, Layer=None):
+        self.Source = Source
+        self.Layer = Layer
+        self.Attributes = {}
+        self.Index = QgsSpatialIndex(self.layer().getFeatures(), flags=QgsSpatialIndex.FlagStoreFeatureGeometries)
+
+    def layer(self):
+        """
+        Returns the reprojected layer. A cached GeoPackage is opened again for
+        each caller so runs in different threads never share one layer.
+        """
+        if self.Layer is not None:
+            return self.Layer
+        return QgsVectorLayer(self.Source, os.path.splitext(os.path.basename(self.Source.split('|')[0]))[0], "ogr")
+
+    def attribute(self, FieldName):
+        """
+        Returns a dictionary of feature id to the value of FieldName, read
+        once and then kept with the index.
+        """
+        if FieldName not in self.Attributes:
+            layer = self.layer()
+            request = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes([FieldName], layer.fields())
+            self.Attributes[FieldName] = {Feature.id(): Feature[FieldName] for Feature in layer.getFeatures(request)}
+        return self.Attributes[FieldName]
+
+def sourceStamp(SourcePath):
+    """
+    Returns the modified times and sizes of a source file and, for a
+    shapefile, of the files beside it holding its attributes, index,
+    projection and encoding, which are rewritten without touching the .shp.
+    """
+    Stem, Extension = os.path.splitext(SourcePath)
+    Files = [SourcePath]
+    if Extension.lower() == '.shp':
+        Folder = os.path.dirname(SourcePath)
+        Files += sorted(os.path.join(Folder, Name) for Name in os.listdir(Folder or '.')
+                        if os.path.normcase(os.path.splitext(Name)[0]) == os.path.normcase(os.path.basename(Stem))
+                        and os.path.splitext(Name)[1].lower() in ['.dbf', '.shx', '.prj', '.cpg'])
+    Stamps = []
+    for FilePath in Files:
+        FileStat = os.stat(FilePath)
+        Stamps.append('{}:{}:{}'.format(os.path.splitext(FilePath)[1].lower(), FileStat.st_mtime_ns, FileStat.st_size))
+    return ';'.join(Stamps)
+
+class ReferenceCache:
+    """
+    Keeps the jurisdiction, address and police area of responsibility layers
+    reprojected to the project coordinate system as GeoPackages, which carry
+    an R-tree spatial index on disk, together with a bulk loaded in-memory
+    spatial index for each. Entries are keyed by source path, the modified
+    times and sizes of its files from sourceStamp, and target coordinate
+    system. Entries for a source that has since changed,
+    or that have not been used for MaxAgeDays, are evicted.
+    """
+
+    # Reference layers already indexed in this QGIS session, by cache key
+    Resident = {}
+    Lock = threading.Lock()
+    MaxAgeDays = 30
+
+    def __init__(self, Directory):
+        self.Directory = Directory
+        self.ManifestPath = os.path.join(Directory, 'manifest.json')
+
+    def readManifest(self):
+        if not os.path.isfile(self.ManifestPath):
+            return {}
+        try:
+            with open(self.ManifestPath) as ManifestFile:
+                return json.load(ManifestFile)
+        except ValueError:
+            return {}
+
+    def writeManifest(self, Manifest):
+        TempPath = self.ManifestPath + '.tmp'
+        with open(TempPath, 'w') as ManifestFile:
+            json.dump(Manifest, ManifestFile, indent=1)
+        os.replace(TempPath, self.ManifestPath)
+
+    def evict(self, Manifest, Key):
+        """
+        Deletes a cached GeoPackage, including any SQLite side files, and
+        forgets its resident index.
+        """
+        Entry = Manifest.pop(Key)
+        for CachedFile in glob.glob(Entry['Path'] + '*'):
+            try:
+                os.remove(CachedFile)
+            except OSError:
+                pass
+        self.Resident.pop(Key, None)
+
+    def layer(self, SourceString, crs, context, feedback):
+        """
+        Returns the ReferenceLayer for a source reprojected to crs, building
+        and caching it when there is no current entry. Sources that are not
+        files, such as memory layers, are reprojected without caching.
+        """
+        SourcePath = SourceString.split('|')[0]
+        if not os.path.isfile(SourcePath):
+            return self.build(SourceString, crs, 'TEMPORARY_OUTPUT', context, feedback)
+        SourcePath = os.path.normcase(os.path.realpath(SourcePath))
+        Modified = sourceStamp(SourcePath)
+        TargetCrs = crs.authid() or crs.toWkt()
+        Key = hashlib.sha1('|'.join([SourcePath, SourceString, Modified, TargetCrs]).encode('utf-8')).hexdigest()
+        with self.Lock:
+            Manifest = self.readManifest()
+            Now = time.time()
+            for OtherKey, Entry in list(Manifest.items()):
+                Stale = Entry['Source'] == SourcePath and Entry['Modified'] != Modified
+                Unused = Now - Entry['Used'] > self.MaxAgeDays * 86400
+                if OtherKey != Key and (Stale or Unused):
+                    self.evict(Manifest, OtherKey)
+            Entry = Manifest.get(Key)
+            if Entry is not None and not os.path.isfile(Entry['Path']):
+                self.evict(Manifest, Key)
+                Entry = None
+            if Entry is None:
+                Entry = {'Source': SourcePath, 'Modified': Modified, 'Crs': TargetCrs,
+                         'Path': os.path.join(self.Directory, Key + '.gpkg')}
+                self.build(SourceString, crs, Entry['Path'], context, feedback)
+            Entry['Used'] = Now
+            Manifest[Key] = Entry
+            self.writeManifest(Manifest)
+            if Key not in self.Resident:
+                self.Resident[Key] = ReferenceLayer(Entry['Path'])
+            return self.Resident[Key]
+
+    def build(self, SourceString, crs, Destination, context, feedback):
+        """
+        Reprojects a reference source to Destination, returning it indexed
+        when it is a temporary layer.
+        """
+        Reproject_params = {
+            'INPUT': SourceString,
+            'OPERATION': '',
+            'TARGET_CRS': crs,
+            'OUTPUT': Destination
+            }
+        outputs = processing.run('native:reprojectlayer', Reproject_params, context=context, feedback=feedback, is_child_algorithm=True)
+        if Destination == 'TEMPORARY_OUTPUT':
+            return ReferenceLayer(None, QgsProcessingUtils.mapLayerFromString(outputs['OUTPUT'], context))
+
+# The runs measuring the peak memory of their stages, and whether tracemalloc was started for them
+MemoryMeasurements = 0
+MemoryTracingStarted = False
+MemoryLock = threading.Lock()
+
+def peakResettable():
+    """
+    Returns True when the peak resident memory of the process can be reset,
+    which Linux allows through /proc/self/clear_refs.
+    """
+    return os.access('/proc/self/clear_refs', os.W_OK)
+
+def beginMemoryMeasurement():
+    """
+    Starts a run that measures the peak memory of its stages. Where the
+    peak resident memory cannot be reset, tracemalloc is started for the
+    first such run, and endMemoryMeasurement stops it after the last one, so
+    runs without a trace never pay for tracing.
+    """
+    global MemoryMeasurements, MemoryTracingStarted
+    with MemoryLock:
+        MemoryMeasurements += 1
+        if not peakResettable() and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            MemoryTracingStarted = True
+
+def endMemoryMeasurement():
+    """
+    Ends a run started with beginMemoryMeasurement, stopping tracemalloc
+    when it was started for the runs and none of them is left.
+    """
+    global MemoryMeasurements, MemoryTracingStarted
+    with MemoryLock:
+        MemoryMeasurements -= 1
+        if MemoryMeasurements == 0 and MemoryTracingStarted:
+            tracemalloc.stop()
+            MemoryTracingStarted = False
+
+def startMemoryPeak():
+    """
+    Starts measuring the peak memory of a stage and returns what memoryPeak
+    needs to report it. On Linux the peak resident memory of the process is
+    reset to the memory in use now. Elsewhere the peak cannot be reset, so
+    the peak of the Python and NumPy allocations traced by tracemalloc is
+    reset instead. Either peak belongs to the whole process, so nothing is
+    measured while more than one run is measuring, such as concurrent jobs
+    of the service, as each would reset the peaks of the others.
+    """
+    with MemoryLock:
+        if MemoryMeasurements > 1:
+            return None, None
+        if peakResettable():
+            try:
+                with open('/proc/self/clear_refs', 'w') as ClearRefs:
+                    ClearRefs.write('5')
+                return 'resident', None
+            except OSError:
+                return None, None
+        if not tracemalloc.is_tracing():
+            return None, None
+        tracemalloc.reset_peak()
+        return 'traced', tracemalloc.get_traced_memory()[0]
+
+def memoryPeak(Start):
+    """
+    Returns the name and value in megabytes of the peak memory since
+    startMemoryPeak returned Start. This is peak_memory_mb, the peak resident
+    memory of the process, when it was reset, and otherwise
+    peak_allocated_mb, the peak traced allocations above those at the start.
+    The value is None when the peak was not measured.
+    """
+    Kind, Allocated = Start
+    if Kind == 'resident':
+        with open('/proc/self/status') as Status:
+            for Line in Status:
+                if Line.startswith('VmHWM:'):
+                    return 'peak_memory_mb', int(Line.split()[1]) / 1024.0
+    if Kind == 'traced' and tracemalloc.is_tracing():
+        return 'peak_allocated_mb', (tracemalloc.get_traced_memory()[1] - Allocated) / 1048576.0
+    return 'peak_memory_mb', None
+
+class StageTrace:
+    """
+    Reports the stages of a run through a multi-step feedback, logging how
+    long each one took. When a trace file is requested it also records the
+    input and output feature counts and the peak memory of each stage, and
+    writes them as Chrome trace events that chrome://tracing or Perfetto can
+    open. The peak is measured afresh for every stage, so it is the stage's
+    own peak rather than the highest seen so far in the run. Without a trace
+    file only the stage times are taken.
+    """
+
+    def __init__(self, feedback, StageCount, TracePath=None):
+        self.feedback = QgsProcessingMultiStepFeedback(StageCount, feedback)
+        self.TracePath = TracePath
+        self.Events = []
+        self.Step = 0
+        self.Current = None
+        self.RunStart = time.perf_counter()
+        self.Measuring = bool(TracePath)
+        if self.Measuring:
+            beginMemoryMeasurement()
+
+    def begin(self, Name, InputCount=None):
+        """
+        Starts timing a stage, ending the previous stage if it is still open.
+        """
+        if self.Current is not None:
+            self.end()
+        self.feedback.setCurrentStep(self.Step)
+        self.Step += 1
+        self.Current = {'Name': Name, 'InputCount': InputCount, 'Start': time.perf_counter(),
+                        'Memory': startMemoryPeak() if self.TracePath else None}
+
+    def end(self, OutputCount=None):
+        """
+        Ends the current stage and reports how long it took.
+        """
+        Stage = self.Current
+        self.Current = None
+        Finish = time.perf_counter()
+        self.feedback.pushInfo('{}: {:.2f}s'.format(Stage['Name'], Finish - Stage['Start']))
+        if not self.TracePath:
+            return
+        Arguments = {'input_features': Stage['InputCount'], 'output_features': OutputCount}
+        MemoryName, PeakMemory = memoryPeak(Stage['Memory'])
+        if PeakMemory is not None:
+            Arguments[MemoryName] = round(PeakMemory, 1)
+        self.Events.append({'name': Stage['Name'], 'cat': 'stage', 'ph': 'X', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                            'ts': round((Stage['Start'] - self.RunStart) * 1000000), 'dur': round((Finish - Stage['Start']) * 1000000),
+                            'args': Arguments})
+
+    def write(self):
+        """
+        Ends any open stage and writes the trace file, if one was requested.
+        """
+        try:
+            if self.Current is not None:
+                self.end()
+            if not self.TracePath:
+                return
+            with open(self.TracePath, 'w') as TraceFile:
+                json.dump({'traceEvents': self.Events, 'displayTimeUnit': 'ms'}, TraceFile, indent=1)
+        finally:
+            self.close()
+
+    def close(self):
+        """
+        Ends the memory measurement of the run, however the run ended.
+        """
+        if self.Measuring:
+            self.Measuring = False
+            endMemoryMeasurement()
+
+class ReportWriter:
+    """
+    Streams the rows of a report to an xlsx workbook, and to CSV and Parquet
+    files beside it when asked, as they are produced so no report is held in
+    memory. The workbook is written with openpyxl in write-only mode when it
+    is installed and with the OGR XLSX driver otherwise. When an output
+    cannot be created, the outputs already opened are closed and deleted.
+    """
+
+    def __init__(self, XlsxPath, fields, Formats, context):
+        self.Fields = fields
+        self.Count = 0
+        self.Appenders = []
+        self.Closers = []
+        self.Paths = []
+        BasePath = os.path.splitext(XlsxPath)[0]
+        try:
+            import openpyxl
+        except ImportError:
+            openpyxl = None
+        try:
+            if openpyxl is not None:
+                Workbook = openpyxl.Workbook(write_only=True)
+                Sheet = Workbook.create_sheet(os.path.basename(BasePath)[:31])
+                Sheet.append(fields.names())
+                self.Appenders.append(Sheet.append)
+                self.Closers.append(lambda: Workbook.save(XlsxPath))
+                self.Paths.append(XlsxPath)
+            else:
+                self.ogrWriter(XlsxPath, 'XLSX', context)
+            if 'CSV' in Formats:
+                CsvFile = open(BasePath + '.csv', 'w', newline='', encoding='utf-8')
+                self.Closers.append(CsvFile.close)
+                self.Paths.append(BasePath + '.csv')
+                CsvWriter = csv.writer(CsvFile)
+                CsvWriter.writerow(fields.names())
+                self.Appenders.append(CsvWriter.writerow)
+            if 'Parquet' in Formats:
+                self.ogrWriter(BasePath + '.parquet', 'Parquet', context)
+        except Exception:
+            self.discard()
+            raise
+
+    def ogrWriter(self, FilePath, DriverName, context):
+        """
+        Adds a table without geometry written through an OGR driver.
+        """
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = DriverName
+        options.layerName = os.path.splitext(os.path.basename(FilePath))[0]
+        Writer = QgsVectorFileWriter.create(FilePath, self.Fields, QgsWkbTypes.NoGeometry, QgsCoordinateReferenceSystem(), context.transformContext(), options)
+        self.Paths.append(FilePath)
+        if Writer.hasError() != QgsVectorFileWriter.NoError:
+            raise QgsProcessingException('Could not write {}: {}'.format(FilePath, Writer.errorMessage()))
+        fields = self.Fields
+
+        def append(Values):
+            Feature = QgsFeature(fields)
+            Feature.setAttributes(Values)
+            Writer.addFeature(Feature)
+
+        self.Appenders.append(append)
+        # The file is completed when the writer is deleted
+        self.Closers.append(Writer.flushBuffer)
+
+    def add(self, Values):
+        """
+        Writes one row to every output of the report.
+        """
+        Values = [None if Value == NULL else Value for Value in Values]
+        for append in self.Appenders:
+            append(Values)
+        self.Count += 1
+
+    def close(self):
+        """
+        Completes every output of the report.
+        """
+        Closers = self.Closers
+        # Dropping the OGR writers closes their files
+        self.Appenders = []
+        self.Closers = []
+        for close in Closers:
+            close()
+
+    def discard(self):
+        """
+        Closes and deletes every output of a report that was not completed,
+        so no partial report is left looking complete.
+        """
+        try:
+            self.close()
+        except Exception:
+            pass
+        for FilePath in self.Paths:
+            try:
+                os.remove(FilePath)
+            except OSError:
+                pass
+        self.Paths = []
 
 class VPCPSLOITool(QgsProcessingAlgorithm):
     """
@@ -66,10 +1488,37 @@ class VPCPSLOITool(QgsProcessingAlgorithm):
     AddressLocs = "Input VicLands Address Data Features"
     VICPolAOR = "Input Victorian Police Area Of Responsibility feature class"
     CoordRefSystem = "Select the correct Project Coordinate System"
+    #optional police station points, and the field holding the station name
+    StationPoints = "Input police station point features"
+    StationField = "Police station name field"
     #This is the final output file
     OutputFile = "Output Feature Class will be output one file directory above analysis directory"
+    #the format of the output feature class, GeoPackage and FlatGeobuf carry a spatial index
+    OutputFormat = "Output format"
+    OutputFormats = [('Shapefile', '.shp', []), ('GeoPackage', '.gpkg', ['SPATIAL_INDEX=YES']), ('FlatGeobuf', '.fgb', ['SPATIAL_INDEX=YES'])]
     #this is the Distance input for analysis buffers
     Distance = 'Use 50 as default value'
+    #write every intermediate shapefile to the analysis directory for debugging
+    KeepIntermediates = "Keep intermediate analysis files"
+    #update the locations saved by the previous run with the rows appended to the spreadsheet since
+    Incremental = "Update the previous run with new spreadsheet rows"
+    #partition the IP locations by UTM zone and process each zone in its own coordinate system and worker process
+    ZonePartitions = "Partition the IP locations by UTM zone"
+    #split very large extracts into grid tiles of this size processed in worker processes, 0 for no tiles
+    TileSize = "Tile size"
+    #write the time, memory and feature counts of each stage to a trace file next to the outputs
+    TraceFile = "Write a stage trace file"
+    #also write the address and accounts reports in these formats beside the xlsx reports
+    ReportFormats = "Additional report formats"
+    ReportFormatOptions = ['CSV', 'Parquet']
+    #load the final outputs into the current project when the run completes
+    LoadOutputs = "Load outputs into the project"
+    #These are the outputs returned to scripts and batch jobs
+    OutputLOI = "OUTPUT_LOI"
+    OutputAddressReport = "OUTPUT_ADDRESS_REPORT"
+    OutputAccountsReport = "OUTPUT_ACCOUNTS_REPORT"
+    OutputTrace = "OUTPUT_TRACE"
+    OutputSweep = "OUTPUT_SWEEP"
 
     def tr(self, string):
         """
@@ -122,8 +1571,8 @@ class VPCPSLOITool(QgsProcessingAlgorithm):
         """
         return self.tr('The VPCPS LOI Tool Converts IP locations into Spatial features' '\n' 
         'The input is a raw data in spreadsheet format, as formatted by the supplying financial institute,'
-        'and the output is a shapefile and two xlsx reports.' '\n'
-        'The shapefile contains LOI field with indexed scores, and closest police station.'
+        'and the output is a feature class, a shapefile, GeoPackage or FlatGeobuf as chosen in Output format, and two xlsx reports.' '\n'
+        'The feature class contains LOI field with indexed scores, and closest police station.'
         'One xlxs conatins LOI with associcated addresses, if available, in the area and the second xlxs report contains'
         'LOI with associated account numbers and names''\n'
         'Locations are buffered to account for IP address collection inaccuracies. Overlapping features are removed'
@@ -131,7 +1580,7 @@ class VPCPSLOITool(QgsProcessingAlgorithm):
         'an indexed score based on the count of activities recorded in that location'
         'and the number of accounts associated with that location.' '\n'
         'The higher the index score the more likelihood suspicious activity has occurred at the location''\n'
-        'This tool works best in single project zone')
+        'This tool works best in single project zone, tick the UTM zone partition option for extracts spanning several zones')
 
     def initAlgorithm(self, config=None):
         """
@@ -147,14 +1596,150 @@ class VPCPSLOITool(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterFeatureSource(self.JurisdictionPGN,self.tr('Select the required bounding jurisdication polygon feature required for analysis'),[QgsProcessing.TypeVector]))
         # Add the police area of responsibility zones polygon vector features. It should be polygon geometry.
         self.addParameter(QgsProcessingParameterFeatureSource(self.VICPolAOR,self.tr('Select the required Victorian Police Area of Responsibility Polygon feature required for analysis'),[QgsProcessing.TypeVector]))
+        # Add the optional police station point features, used for locations outside every area of responsibility and for the distance to the station
+        self.addParameter(QgsProcessingParameterFeatureSource(self.StationPoints,self.tr('Select the police station point features to find the nearest station and its distance (optional)'),[QgsProcessing.TypeVectorPoint],optional=True))
+        self.addParameter(QgsProcessingParameterField(self.StationField,self.tr('Police station name field of the station points'),defaultValue='VicPolSTN',parentLayerParameterName=self.StationPoints,optional=True))
         # Add the VicLands Address Data point vector features. It should be point geometry.
         self.addParameter(QgsProcessingParameterFeatureSource(self.AddressLocs,self.tr('Select the Vic Lands Address Point Data feature required for analysis'),[QgsProcessing.TypeVector]))
         # Add the source of the Distance for location buffer
-        self.addParameter(QgsProcessingParameterNumber(self.Distance,self.tr('Input the distance to buffer locations for Analysis default is 50m')))
+        self.addParameter(QgsProcessingParameterString(self.Distance,self.tr('Input the distance to buffer locations for Analysis default is 50m, or several distances separated by commas to compare them'),defaultValue='50'))
         # Add the Analysis folder location as Destination for output files
         self.addParameter(QgsProcessingParameterFolderDestination(self.Analysispath,self.tr('Select the Analysis directory for output files and to review each output'),))
         # Add the Output file name as an option as a string
-        self.addParameter(QgsProcessingParameterString(self.OutputFile,self.tr('Output filename NO EXTENSION output extension will default to ".shp" format'),))
+        self.addParameter(QgsProcessingParameterString(self.OutputFile,self.tr('Output filename NO EXTENSION output extension is set by the output format'),))
+        # Add the output format, GeoPackage keeps an R-tree and FlatGeobuf a packed Hilbert R-tree for fast extent queries
+        self.addParameter(QgsProcessingParameterEnum(self.OutputFormat,self.tr('Output format of the feature class, GeoPackage and FlatGeobuf are spatially indexed'),options=[Format[0] for Format in self.OutputFormats],defaultValue=0))
+        # Intermediate layers are held in memory unless they are requested for debugging
+        self.addParameter(QgsProcessingParameterBoolean(self.KeepIntermediates,self.tr('Keep intermediate analysis files in the Analysis directory (slower, for debugging)'),defaultValue=False))
+        # Appended spreadsheet rows can be added to the locations saved by the previous run
+        self.addParameter(QgsProcessingParameterBoolean(self.Incremental,self.tr('Update the locations saved by the previous run with rows appended to the spreadsheet'),defaultValue=False))
+        # Extracts spanning several UTM zones can be processed per zone, in parallel
+        self.addParameter(QgsProcessingParameterBoolean(self.ZonePartitions,self.tr('Partition the IP locations by UTM zone and process each zone in its own projection, in parallel (for extracts spanning several zones)'),defaultValue=False))
+        # Very large extracts can be processed in grid tiles, in parallel
+        self.addParameter(QgsProcessingParameterNumber(self.TileSize,self.tr('Process the IP locations in grid tiles of this size in metres, in parallel (for very large extracts, 0 for no tiles)'),QgsProcessingParameterNumber.Double,defaultValue=0,minValue=0))
+        # A trace of each stage shows where the time and memory of a run go
+        self.addParameter(QgsProcessingParameterBoolean(self.TraceFile,self.tr('Write the time, memory and feature counts of each stage to a trace file next to the outputs'),defaultValue=False))
+        # The reports can also be written as CSV or Parquet for other tools
+        self.addParameter(QgsProcessingParameterEnum(self.ReportFormats,self.tr('Also write the address and accounts reports in these formats'),options=self.ReportFormatOptions,allowMultiple=True,optional=True,defaultValue=[]))
+        # Loading into the map is optional so the tool can run headless and in batch jobs
+        self.addParameter(QgsProcessingParameterBoolean(self.LoadOutputs,self.tr('Load the output feature class into the project when complete'),defaultValue=True))
+        # Outputs returned to callers such as qgis_process and batch scripts
+        self.addOutput(QgsProcessingOutputVectorLayer(self.OutputLOI,self.tr('Locations of Interest')))
+        self.addOutput(QgsProcessingOutputFile(self.OutputAddressReport,self.tr('LOI address report')))
+        self.addOutput(QgsProcessingOutputFile(self.OutputAccountsReport,self.tr('LOI accounts report')))
+        self.addOutput(QgsProcessingOutputFile(self.OutputTrace,self.tr('Stage trace')))
+        self.addOutput(QgsProcessingOutputFile(self.OutputSweep,self.tr('Distance comparison')))
+
+    def parseDistances(self, Text):
+        """
+        Returns the buffer distances in a comma separated list, smallest first.
+        """
+        Distances = []
+        for Item in re.split(r'[,;\s]+', Text.strip()):
+            if not Item:
+                continue
+            try:
+                Value = float(Item)
+            except ValueError:
+                Value = 0
+            if not Value > 0:
+                raise QgsProcessingException(self.tr('The distance must be a positive number or a list of them separated by commas, not {}').format(Text))
+            Value = int(Value) if Value.is_integer() else Value
+            if Value not in Distances:
+                Distances.append(Value)
+        if not Distances:
+            raise QgsProcessingException(self.tr('Enter a distance to buffer locations'))
+        return sorted(Distances)
+
+    def intermediateOutput(self, Analysispath, FileName, KeepIntermediates):
+        """
+        Returns the OUTPUT value for an intermediate stage, either a shapefile
+        in the analysis directory or a temporary memory layer.
+        """
+        if KeepIntermediates:
+            return os.path.join(Analysispath,FileName)
+        return 'TEMPORARY_OUTPUT'
+
+    def runStage(self, AlgorithmId, params, context, feedback):
+        """
+        Runs a processing algorithm as a child of this algorithm and returns
+        its OUTPUT as a layer, without reopening it from disk when it is held
+        in memory.
+        """
+        outputs = processing.run(AlgorithmId, params, context=context, feedback=feedback, is_child_algorithm=True)
+        return QgsProcessingUtils.mapLayerFromString(outputs['OUTPUT'], context)
+
+    def writeFeatures(self, Destination, fields, GeometryType, crs, features, context, LayerOptions=None, OpenLayer=True):
+        """
+        Writes features to a new layer at Destination in one bulk insert and
+        returns the layer, held in memory for a temporary destination. A
+        layer nothing reads back is not opened again when OpenLayer is False.
+        """
+        if Destination == 'TEMPORARY_OUTPUT':
+            Destination = 'memory:'
+        sink, Destination = QgsProcessingUtils.createFeatureSink(Destination, context, fields, GeometryType, crs, {}, [], LayerOptions or [])
+        if sink is None:
+            raise QgsProcessingException(self.tr('Could not create {}').format(Destination))
+        sink.addFeatures(features, QgsFeatureSink.FastInsert)
+        del sink
+        if not OpenLayer:
+            return None
+        return QgsProcessingUtils.mapLayerFromString(Destination, context)
+
+    def sourceString(self, parameters, name, context):
+        """
+        Returns the data source of a layer parameter. A layer picked from the
+        project is given as its layer id, so it is resolved to the file it
+        was loaded from, for the caches to recognise the file.
+        """
+        Value = self.parameterAsString(parameters, name, context)
+        if not Value or os.path.isfile(Value.split('|')[0]):
+            return Value
+        layer = QgsProcessingUtils.mapLayerFromString(Value, context, False)
+        if layer is not None and layer.providerType() == 'ogr' and os.path.isfile(layer.source().split('|')[0]):
+            return layer.source()
+        return Value
+
+    def columnField(self, Column, Values):
+        """
+        Returns a field for a decoded spreadsheet column, typed from its
+        distinct values so customer ids stay numbers when the sheet holds them
+        as numbers.
+        """
+        Present = [Value for Value in Values if Value is not None]
+        if Present and all(isinstance(Value, int) and not isinstance(Value, bool) for Value in Present):
+            return QgsField(Column,QVariant.LongLong)
+        if Present and all(isinstance(Value, (int, float)) and not isinstance(Value, bool) for Value in Present):
+            return QgsField(Column,QVariant.Double)
+        return QgsField(Column,QVariant.String)
+
+    def loadIntermediate(self, layer, FileName, KeepIntermediates, context):
+        """
+        Queues an intermediate layer to be loaded into the map when the run
+        completes, if intermediates are kept.
+        """
+        if KeepIntermediates:
+            self.loadOnCompletion(layer.source(),FileName[:-4],context)
+        return layer
+
+    def loadOnCompletion(self, LayerId, LayerName, context):
+        """
+        Hands a layer to processing to add to the project once the algorithm
+        has finished, which is safe from a background thread and does nothing
+        when there is no project to load into.
+        """
+        if context.project() is not None:
+            context.addLayerToLoadOnCompletion(LayerId,QgsProcessingContext.LayerDetails(LayerName,context.project(),LayerName))
+
+    def fieldName(self, layer, name):
+        """
+        Returns the name of the field in layer that name refers to, allowing
+        for the 10 character field names of shapefile intermediates.
+        """
+        for field in layer.fields():
+            if field.name()[:10] == name[:10]:
+                return field.name()
+        return name
 
 
 
@@ -162,6 +1747,18 @@ class VPCPSLOITool(QgsProcessingAlgorithm):
         """
         Here is where the processing itself takes place.
         """
+        self.Trace = None
+        try:
+            return self.runAnalysis(parameters, context, feedback)
+        finally:
+            # The memory measurement of the stage trace ends even when the run fails or is canceled
+            if self.Trace is not None:
+                self.Trace.close()
+
+    def runAnalysis(self, parameters, context, feedback):
+        """
+        Runs the analysis, keeping its stage trace in self.Trace.
+        """
 
         # Retrieve the feature source and sink. The 'dest_id' variable is used
         # to uniquely identify the feature sink, and must be included in the
@@ -176,290 +1773,344 @@ class VPCPSLOITool(QgsProcessingAlgorithm):
             raise QgsProcessingException(self.invalidSourceError(parameters, self.DataPoints))
 
         #define variables set raw file path and analysis file path here
-        Analysispath = self.parameterAsString(parameters, self.Analysispath,context)
-        PathList = Analysispath.split('\\')
-        NewPath = PathList[:-1]
-        ShortPath = '\\'.join(NewPath)
+        Analysispath = os.path.normpath(self.parameterAsString(parameters, self.Analysispath,context))
+        ShortPath = os.path.dirname(Analysispath)
         #set these files as raw data input files
-        DataPoints= self.parameterAsString(parameters, self.DataPoints,context)
-        JurisdictionPGN = self.parameterAsString(parameters, self.JurisdictionPGN,context)
-        AddressLocs = self.parameterAsString(parameters, self.AddressLocs,context)
-        VICPolAOR = self.parameterAsString(parameters, self.VICPolAOR,context)
+        DataPoints= self.sourceString(parameters, self.DataPoints,context)
+        JurisdictionPGN = self.sourceString(parameters, self.JurisdictionPGN,context)
+        AddressLocs = self.sourceString(parameters, self.AddressLocs,context)
+        VICPolAOR = self.sourceString(parameters, self.VICPolAOR,context)
+        StationPoints = self.sourceString(parameters, self.StationPoints,context)
+        StationField = self.parameterAsString(parameters, self.StationField,context) or 'VicPolSTN'
         CoordSys = self.parameterAsCrs(parameters, self.CoordRefSystem,context)
-        #These are the intermediate analysis output files
-        IPLocations = "IPLocations.shp"
-        AddressesofInterest ="AddrInterest.shp"
+        #These are the intermediate analysis output files, only written when kept
+        KeepIntermediates = self.parameterAsBool(parameters, self.KeepIntermediates,context)
+        LoadOutputs = self.parameterAsBool(parameters, self.LoadOutputs,context)
+        Incremental = self.parameterAsBool(parameters, self.Incremental,context)
+        ZonePartitions = self.parameterAsBool(parameters, self.ZonePartitions,context)
+        TileSize = self.parameterAsDouble(parameters, self.TileSize,context)
+        if ZonePartitions and TileSize > 0:
+            feedback.pushInfo(self.tr('Zone partitions are already processed in parallel, the tile size is not used'))
+        if ZonePartitions and Incremental:
+            feedback.pushInfo(self.tr('Zone partitions are always run in full, the saved locations will not be updated'))
+            Incremental = False
         IPLocsClip = "IPLocsClip.shp"
-        IPLocsWGSz55 = "IPLocsWGSz55.shp"
         JurisdictionPGNWGSz55 ="JDictionPGNWGSz55.shp"
-        IPLocsBuffer = "IPLocsBuffer.shp"
-        IpBuffClean = "IpBuffClean.shp"
-        LocIncidents = "LocIncidents.shp"
-        LocIdentities = "LocIdentities.shp"
-        LOIRating = "LOIRating.shp"
-        LOIOrder = "LOIOrder.shp"
-        JoinAccts = "JoinAccts.shp"
         #This is the final output file
         LOIAnalysis = self.parameterAsString(parameters, self.OutputFile,context)
-        #this is the Distance input for analysis buffers
-        Distance = self.parameterAsInt(parameters, self.Distance,context)
-        
-        # Reproject JurisdictionPGN to WGS84 Zone 55
-        JurisdictionPGNProject_params = {
-            'INPUT': JurisdictionPGN,
-            'OPERATION': '',
-            'TARGET_CRS': QgsCoordinateReferenceSystem(CoordSys),
-            'OUTPUT': Analysispath+'\\'+JurisdictionPGNWGSz55
-            }
-        JurisdictionPGN_outputs = processing.run('native:reprojectlayer', JurisdictionPGNProject_params)
+        #this is the Distance input for analysis buffers, several distances are each analysed and compared
+        Distances = self.parseDistances(self.parameterAsString(parameters, self.Distance,context))
+        #this is the extension and layer options of the output feature class format
+        OutputExtension, OutputLayerOptions = self.OutputFormats[self.parameterAsEnum(parameters, self.OutputFormat,context)][1:]
+        #these are the formats the reports are written in besides xlsx
+        ReportFormats = [self.ReportFormatOptions[i] for i in self.parameterAsEnums(parameters, self.ReportFormats,context)]
+        #this is the stage trace, written next to the outputs when requested
+        TracePath = os.path.join(ShortPath,LOIAnalysis+"_Trace.json") if self.parameterAsBool(parameters, self.TraceFile,context) else None
+
+        # Time each stage and report progress through the stages, child algorithms report within their stage
+        Trace = self.Trace = StageTrace(feedback, 2 + KeepIntermediates + 7 * len(Distances) + (len(Distances) > 1), TracePath)
+        feedback = Trace.feedback
+
+        Trace.begin('Reference layers')
+        # Reproject and index the reference layers, reusing the cached copies when the sources are unchanged
+        References = ReferenceCache(cacheDirectory('reference'))
+        JurisdictionReference = References.layer(JurisdictionPGN, CoordSys, context, feedback)
+        AORReference = References.layer(VICPolAOR, CoordSys, context, feedback)
+        AddressReference = References.layer(AddressLocs, CoordSys, context, feedback)
+        StationReference = References.layer(StationPoints, CoordSys, context, feedback) if StationPoints else None
+        JurisdictionPGNLayer = JurisdictionReference.layer()
 
         #Identify, name and Load JurisdictionPGN into map
-        JurisdictionPGNLayer = iface.addVectorLayer(JurisdictionPGNProject_params['OUTPUT'],JurisdictionPGNWGSz55[:-4], "ogr")
-
-        # Create points layer from table
-        ImportPoints_params = {
-            'INPUT': DataPoints,
-            'MFIELD': '',
-            'TARGET_CRS': QgsCoordinateReferenceSystem('EPSG:4326'),
-            'XFIELD': 'IP LON',
-            'YFIELD': 'IP LAT',
-            'ZFIELD': '',
-            'OUTPUT': Analysispath+'\\'+IPLocations
-            }
-        ImportPoints_outputs = processing.run('native:createpointslayerfromtable', ImportPoints_params)
+        JurisdictionPGNLayer = self.loadIntermediate(JurisdictionPGNLayer,JurisdictionPGNWGSz55,KeepIntermediates,context)
 
-        #Identify, name and Load ImportPoints into map
-        ImportPointsLayer = iface.addVectorLayer(ImportPoints_params['OUTPUT'],IPLocations[:-4], "ogr")
+        Trace.end()
 
-        # Reproject IP Locations to WGS84 Zone 55
-        IPLocsProject_params = {
-            'INPUT': ImportPointsLayer,
-            'OPERATION': '',
-            'TARGET_CRS': QgsCoordinateReferenceSystem(CoordSys),
-            'OUTPUT': Analysispath+'\\'+IPLocsWGSz55
-            }
-        IPLocsProject_outputs = processing.run('native:reprojectlayer', IPLocsProject_params)
-    
-        #Identify, name and Load Import Projected Points into map
-        IPLocsProjectLayer = iface.addVectorLayer(IPLocsProject_params['OUTPUT'],IPLocsWGSz55[:-4], "ogr")
-
-        # Extract by location
-        ipSelection_params = {
-            'INPUT': IPLocsProjectLayer,
-            'INTERSECT': JurisdictionPGNLayer,
-            'PREDICATE': [0],  # intersect
-            'OUTPUT': Analysispath+'\\'+IPLocsClip
-            }
-        ipSelection_Outputs = processing.run('native:extractbylocation', ipSelection_params)
-
-        #Identify, name and Load Extracted Points into map
-        ipLocsSelectLayer = iface.addVectorLayer(ipSelection_params['OUTPUT'],IPLocsClip[:-4], "ogr")
-
-        # Buffer the IP Locations 50m(Radius) as IP distance can be accurate to 100m
-        ipBuffer_params = {
-            'DISSOLVE': True,
-            'DISTANCE': Distance,
-            'END_CAP_STYLE': 0,  # Round
-            'INPUT': ipLocsSelectLayer,
-            'JOIN_STYLE': 0,  # Round
-            'MITER_LIMIT': 2,
-            'SEGMENTS': 5,
-            'OUTPUT': Analysispath+'\\'+IPLocsBuffer
-            }
-        ipBuffer_Outputs = processing.run('native:buffer', ipBuffer_params)
-
-        #Identify, name and Load IP Point buffers into map
-        ipBufferLayer = iface.addVectorLayer(ipBuffer_params['OUTPUT'],IPLocsBuffer[:-4], "ogr")
-
-        #Delete unecessary fields from buffers attribute table before splitting features
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        ipBufferLayer.dataProvider().deleteAttributes([0])
-        #Create new attribute fields and update
-        ipBufferLayer.dataProvider().addAttributes([QgsField("LOI",QVariant.Double,"Double",4,2),QgsField("InCd_Indx",QVariant.Double,"Double",4,2),QgsField("Id_Indx",QVariant.Double,"Double",4,2),QgsField("IndexCalc",QVariant.Double,"Double",4,2)])
-        ipBufferLayer.updateFields()
-
-        # Multipart to singleparts
-        SinglePart_params = {
-            'INPUT': ipBufferLayer,
-            'OUTPUT': Analysispath+'\\'+IpBuffClean
-        }
-        ipLocations_outputs = processing.run('native:multiparttosingleparts', SinglePart_params)
-
-        #Identify, name and Load Singular IP Location Polygons into map
-        ipLocationsLayer = iface.addVectorLayer(SinglePart_params['OUTPUT'],IpBuffClean[:-4], "ogr")
-
-        # Count points as incidents of application login at individual locations
-        LocIncidents_params = {
-            'CLASSFIELD': '',
-            'FIELD': 'INCIDENTS',
-            'POINTS': ipLocsSelectLayer,
-            'POLYGONS': ipLocationsLayer,
-            'WEIGHT': '',
-            'OUTPUT': Analysispath+'\\'+LocIncidents
-            }
-        LocIncidents_Outputs = processing.run('native:countpointsinpolygon', LocIncidents_params)
-
-        #Identify, name and Load Singular IP Location Polygons into map
-        LocIncidentsLayer = iface.addVectorLayer(LocIncidents_params['OUTPUT'],LocIncidents[:-4], "ogr")
-
-        # Count points as identities logging in at  individual locations
-        LocIdentities_params = {
-            'CLASSFIELD': 'CUSTOMER N',
-            'FIELD': 'IDENTITIES',
-            'POINTS': ipLocsSelectLayer,
-            'POLYGONS': LocIncidentsLayer,
-            'WEIGHT': '',
-            'OUTPUT': Analysispath+'\\'+LocIdentities
-            }
-        LocIdentities_Outputs = processing.run('native:countpointsinpolygon', LocIdentities_params)
-
-        #Identify, name and Load Singular IP Location Polygons into map
-        LocIdentitiesLayer = iface.addVectorLayer(LocIdentities_params['OUTPUT'],LocIdentities[:-4], "ogr")
-
-        #Identify the minimum and maximum values for the incidents that occur
-        IncidentMin = LocIdentitiesLayer.aggregate(QgsAggregateCalculator.Min, 'INCIDENTS')
-        IncidentMinNumber = IncidentMin[0]
-
-        IncidentMax = LocIdentitiesLayer.aggregate(QgsAggregateCalculator.Max, 'INCIDENTS')
-        IncidentMaxNumber = IncidentMax[0]
-
-        # Calculate index value for incidents that occur at each location
-        Incidents =LocIdentitiesLayer.getFeatures()
-        for Incident in Incidents:
-            id=Incident.id()
-            IncidentIndex = ((Incident["INCIDENTS"]-IncidentMinNumber)/(IncidentMaxNumber-IncidentMinNumber))
-            attrs={1:IncidentIndex}
-            LocIdentitiesLayer.dataProvider().changeAttributeValues({id:attrs})
-
-        #Identify the minimum and maximum values for the incidents that occur
-        IdentityMin = LocIdentitiesLayer.aggregate(QgsAggregateCalculator.Min, 'IDENTITIES')
-        IdentityMinNumber = IdentityMin[0]
-
-        IdentityMax = LocIdentitiesLayer.aggregate(QgsAggregateCalculator.Max, 'IDENTITIES')
-        IdentityMaxNumber = IdentityMax[0]
-
-        # Calculate index value for account names that occur at a given location
-        Idents =LocIdentitiesLayer.getFeatures()
-        for Ident in Idents:
-            id=Ident.id()
-            IDIndex = ((Ident["IDENTITIES"]-IdentityMinNumber)/(IdentityMaxNumber-IdentityMinNumber))
-            attrs={2:IDIndex}
-            LocIdentitiesLayer.dataProvider().changeAttributeValues({id:attrs})
-    
-        # Calculate combined index value for each location
-        Indexes =LocIdentitiesLayer.getFeatures()
-        for Index in Indexes:
-            id=Index.id()
-            LocIndex = (((Index["InCd_Indx"]*.5)+(Index ["Id_Indx"]*0.5))*100)
-            attrs={3:LocIndex}
-            LocIdentitiesLayer.dataProvider().changeAttributeValues({id:attrs})
-        
-        # Order the features by Indexes Score
-        LOIOrder_params = {
-            'ASCENDING': False,
-            'EXPRESSION': 'IndexCalc',
-            'INPUT': LocIdentitiesLayer,
-            'NULLS_FIRST': False,
-            'OUTPUT': Analysispath+'\\'+LOIOrder
-            }
-        LOIOrder_outputs = processing.run('native:orderbyexpression', LOIOrder_params)
-
-        #Identify, name and Load locations ordered by Index score highest to lowest
-        LOIOrderLayer = iface.addVectorLayer(LOIOrder_params['OUTPUT'],LOIOrder[:-4], "ogr")
-
-        # Adjust Index score to add 1 to start list at 1
-        LOIRating_params = {
-            'FIELD_LENGTH': 4,
-            'FIELD_NAME': 'LOI',
-            'FIELD_PRECISION': 0,
-            'FIELD_TYPE': 1,  # Integer
-            'FORMULA': '@row_number+1',
-            'INPUT': LOIOrderLayer,
-            'OUTPUT': Analysispath+'\\'+LOIRating
-            }
-        LOIRating_outputs = processing.run('native:fieldcalculator', LOIRating_params)
+        # Read the spreadsheet into columns, reusing the cached columns when the spreadsheet is unchanged
+        Trace.begin('Spreadsheet ingest')
+        SourceFields = {'IP LON': 'IP LON', 'IP LAT': 'IP LAT'}
+        for Column in IPLocationColumns.Columns:
+            SourceFields[Column] = self.fieldName(source,Column)
+        for FieldName in SourceFields.values():
+            if source.fields().indexOf(FieldName) < 0:
+                raise QgsProcessingException(self.tr('The IP Locations spreadsheet has no {} field').format(FieldName))
+        IPColumns = readIPLocations(source, DataPoints, SourceFields, cacheDirectory('ingest'))
+        Trace.end(len(IPColumns))
+
+        # The coordinates are transformed to the project coordinate system and those inside the jurisdiction kept in one pass.
+        # Every distance clips the same rows, so each range of rows is only clipped once
+        JurisdictionBoundary = QgsGeometry.unaryUnion([Jurisdiction.geometry() for Jurisdiction in JurisdictionPGNLayer.getFeatures()])
+        # Saved locations are only reused inside the same boundary, whatever layer it comes from
+        JurisdictionDigest = hashlib.sha1(bytes(JurisdictionBoundary.asWkb())).hexdigest()
+        IPTransform = QgsCoordinateTransform(QgsCoordinateReferenceSystem('EPSG:4326'), CoordSys, context.transformContext())
+
+        Clipped = {}
+
+        def clipRows(FirstRow):
+            if FirstRow not in Clipped:
+                xs, ys, Rows = projectAndClip(IPColumns.Lons[FirstRow:], IPColumns.Lats[FirstRow:], IPTransform, JurisdictionBoundary)
+                Clipped[FirstRow] = (xs, ys, Rows + FirstRow)
+            return Clipped[FirstRow]
+
+        # Create points layer of the IP locations inside the jurisdiction, only needed when intermediates are kept
+        if KeepIntermediates:
+            PointXs, PointYs, PointRows = clipRows(0)
+            Trace.begin('IP location points', len(PointRows))
+            PointFields = QgsFields()
+            for Column in IPLocationColumns.Columns:
+                PointFields.append(self.columnField(Column,IPColumns.Values[Column]))
+            PointFeatures = []
+            for x, y, Row in zip(PointXs.tolist(), PointYs.tolist(), PointRows.tolist()):
+                PointFeature = QgsFeature(PointFields)
+                PointFeature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x,y)))
+                PointFeature.setAttributes([IPColumns.decode(Column,Row) for Column in IPLocationColumns.Columns])
+                PointFeatures.append(PointFeature)
+            ipLocsSelectLayer = self.writeFeatures(self.intermediateOutput(Analysispath,IPLocsClip,KeepIntermediates), PointFields, QgsWkbTypes.Point, CoordSys, PointFeatures, context)
+
+            #Identify, name and Load Extracted Points into map
+            ipLocsSelectLayer = self.loadIntermediate(ipLocsSelectLayer,IPLocsClip,KeepIntermediates,context)
+            Trace.end(ipLocsSelectLayer.featureCount())
+
+        # Each location takes the station of the area of responsibility its incident centre is in, or the nearest station
+        Stations = StationLookup(AORReference, 'VicPolSTN', StationReference, StationField)
+
+        # Everything from here on depends on the distance, so it is repeated for each distance with the outputs named after it
+        Results = []
+        for Distance in Distances:
+            Suffix = ' at {}m'.format(Distance) if len(Distances) > 1 else ''
+            LOIName = LOIAnalysis + ('_{}m'.format(Distance) if len(Distances) > 1 else '')
+            LocIdentities = "LocIdentities" + LOIName[len(LOIAnalysis):] + ".shp"
+            LOIOrder = "LOIOrder" + LOIName[len(LOIAnalysis):] + ".shp"
 
-        #Identify, name and Load locations with new ordered score column
-        LOIRatingLayer = iface.addVectorLayer(LOIRating_params['OUTPUT'],LOIRating[:-4], "ogr")
+            # Reuse the locations saved by the previous run when only rows have been appended to the spreadsheet since
+            Trace.begin('Locations' + Suffix, len(IPColumns))
+            StatePath = os.path.join(Analysispath,LOIName+"_State.npz")
+            StateSettings = {'Distance': Distance, 'Crs': CoordSys.authid() or CoordSys.toWkt(), 'Jurisdiction': JurisdictionDigest}
+            State = None
+            if Incremental and not os.path.isfile(StatePath):
+                feedback.pushInfo(self.tr('There are no saved locations at {}, running the full analysis').format(StatePath))
+            elif Incremental:
+                State = LocationState.load(StatePath)
+                if not State.matches(StateSettings, IPColumns):
+                    feedback.pushInfo(self.tr('The saved locations do not match this spreadsheet, distance or jurisdiction, running the full analysis'))
+                    State = None
+            if State is not None:
+                # Only the appended rows are transformed, clipped and placed into locations
+                PreviousRowCount = State.RowCount
+                NewXs, NewYs, NewRows = clipRows(PreviousRowCount)
+                State.extend(IPColumns, NewRows, NewXs, NewYs, Distance)
+                feedback.pushInfo(self.tr('Added {} new rows to the saved locations').format(len(IPColumns) - PreviousRowCount))
+            else:
+                # Place every IP location inside the jurisdiction, IP locations whose buffers overlap form one individual location
+                PointXs, PointYs, PointRows = clipRows(0)
+                if ZonePartitions:
+                    # Each zone is buffered in its own projection and the locations of all zones are scored and ranked together
+                    Labels, Outlines = locateByZone(IPColumns.Lons[PointRows], IPColumns.Lats[PointRows], CoordSys, Distance, feedback)
+                    State = LocationState.fromLabels(StateSettings, IPColumns, PointRows, PointXs, PointYs, Labels, Outlines)
+                elif TileSize > 0:
+                    # Tiles are clustered with a halo of their neighbours' points and stitched back into the same locations as one pass
+                    Labels, Outlines = locateByTile(PointXs, PointYs, Distance, TileSize, feedback)
+                    State = LocationState.fromLabels(StateSettings, IPColumns, PointRows, PointXs, PointYs, Labels, Outlines)
+                else:
+                    State = LocationState.build(StateSettings, IPColumns, PointRows, PointXs, PointYs, Distance)
+            if Incremental:
+                State.save(StatePath)
+            PointXs, PointYs, PointRows = State.PointXs, State.PointYs, State.PointRows
+            Trace.end(len(State.Incidents))
+
+            # Incidents of application login, identities logging in and the buffered outline of each individual location
+            Trace.begin('Location features' + Suffix, len(State.Incidents))
+            Incidents = State.Incidents
+            Identities = State.Identities
+            LocationOutlines = [QgsGeometry(Outline) for Outline in State.Outlines]
+
+            # Create the location features with their counts and the index fields to be calculated
+            LocationFields = QgsFields()
+            for LocationField in [QgsField("LOI",QVariant.Int,"Integer",10),QgsField("InCd_Indx",QVariant.Double,"Double",4,2),QgsField("Id_Indx",QVariant.Double,"Double",4,2),QgsField("IndexCalc",QVariant.Double,"Double",4,2),QgsField("INCIDENTS",QVariant.Int),QgsField("IDENTITIES",QVariant.Int)]:
+                LocationFields.append(LocationField)
+            LocationFeatures = []
+            for LocationId, Outline in enumerate(LocationOutlines):
+                Outline.convertToMultiType()
+                LocationFeature = QgsFeature(LocationFields)
+                LocationFeature.setGeometry(Outline)
+                LocationFeature.setAttributes([None,None,None,None,int(Incidents[LocationId]),int(Identities[LocationId])])
+                LocationFeatures.append(LocationFeature)
+            LocIdentitiesLayer = self.writeFeatures(self.intermediateOutput(Analysispath,LocIdentities,KeepIntermediates), LocationFields, QgsWkbTypes.MultiPolygon, CoordSys, LocationFeatures, context)
+
+            #Identify, name and Load Singular IP Location Polygons into map
+            LocIdentitiesLayer = self.loadIntermediate(LocIdentitiesLayer,LocIdentities,KeepIntermediates,context)
+            Trace.end(LocIdentitiesLayer.featureCount())
+
+            # Read the incidents and identities of every location once
+            Trace.begin('Index scores' + Suffix, LocIdentitiesLayer.featureCount())
+            ScoreRequest = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setSubsetOfAttributes(['INCIDENTS','IDENTITIES'],LocIdentitiesLayer.fields())
+            LocationIds = []
+            Incidents = []
+            Identities = []
+            for Location in LocIdentitiesLayer.getFeatures(ScoreRequest):
+                LocationIds.append(Location.id())
+                Incidents.append(Location["INCIDENTS"])
+                Identities.append(Location["IDENTITIES"])
+
+            # Calculate the incident, identity and combined index values for all locations together
+            IncidentIndex, IdentityIndex, LocIndex = scoreLocations(Incidents, Identities)
+
+            # Rate the locations from 1 by Index score highest to lowest, equal scores in the order of their first row
+            LocationOrder = np.argsort(-LocIndex, kind='stable')
+            Ratings = np.empty(len(LocationOrder), dtype=np.int64)
+            Ratings[LocationOrder] = np.arange(1, len(LocationOrder) + 1)
+
+            # Write the rating and the three index values back to the locations in a single update
+            LocFields = LocIdentitiesLayer.fields()
+            LOIField = LocFields.indexOf('LOI')
+            InCdField = LocFields.indexOf('InCd_Indx')
+            IdField = LocFields.indexOf('Id_Indx')
+            IndexField = LocFields.indexOf('IndexCalc')
+            LocIdentitiesLayer.dataProvider().changeAttributeValues({
+                id: {LOIField: int(Ratings[i]), InCdField: float(IncidentIndex[i]), IdField: float(IdentityIndex[i]), IndexField: float(LocIndex[i])}
+                for i, id in enumerate(LocationIds)})
+            Trace.end(len(LocationIds))
+
+            # Order the features by their rating, the ordered layer is only written when intermediates are kept
+            Trace.begin('LOI ranking' + Suffix, len(LocationOrder))
+            if KeepIntermediates:
+                LOIOrder_params = {
+                    'ASCENDING': True,
+                    'EXPRESSION': 'LOI',
+                    'INPUT': LocIdentitiesLayer,
+                    'NULLS_FIRST': False,
+                    'OUTPUT': self.intermediateOutput(Analysispath,LOIOrder,KeepIntermediates)
+                    }
+                LOIOrderLayer = self.runStage('native:orderbyexpression', LOIOrder_params, context, feedback)
+
+                #Identify, name and Load locations ordered by Index score highest to lowest
+                LOIOrderLayer = self.loadIntermediate(LOIOrderLayer,LOIOrder,KeepIntermediates,context)
+
+            Trace.end(len(LocationOrder))
     
-        # Join attributes by location Locations to VicPolStns
-        LOIAnalysis_params = {
-            'DISCARD_NONMATCHING': False,
-            'INPUT': LOIRatingLayer,
-            'JOIN': VICPolAOR,
-            'JOIN_FIELDS': ['VicPolSTN'],
-            'METHOD': 2,  # Take attributes of the feature with largest overlap only (one-to-one)
-            'PREDICATE': [0],  # intersects
-            'PREFIX': '',
-            'OUTPUT': ShortPath+'\\'+LOIAnalysis+".shp"
-            }
-        LOIAnalysis_params_Outputs = processing.run('native:joinattributesbylocation', LOIAnalysis_params)
-
-        #Identify, name and Load locations with the closest associated VicPol STN
-        LOIAnalysisLayer = iface.addVectorLayer(LOIAnalysis_params['OUTPUT'],LOIAnalysis, "ogr")
-
-        # Join attributes by location VicPOL output to Address loocations
-        AddressesofInterest_params = {
-            'DISCARD_NONMATCHING': False,
-            'INPUT': LOIAnalysisLayer,
-            'JOIN': AddressLocs,
-            'JOIN_FIELDS': ['EZI_ADD'],
-            'METHOD': 0,  # Take attributes of the feature with largest overlap only (one-to-many)
-            'PREDICATE': [0],  # intersects
-            'PREFIX': '',
-            'OUTPUT': Analysispath+'\\'+AddressesofInterest
-            }
-        AddressesofInterest_outputs = processing.run('native:joinattributesbylocation', AddressesofInterest_params)
+            # Join attributes by location Locations to VicPolStns
+            Trace.begin('Police stations' + Suffix, len(LocationOrder))
+            # Assign the stations of every location in one batch
+            CentreXs = np.bincount(State.PointLabels, weights=State.PointXs, minlength=len(State.Incidents)) / State.Incidents
+            CentreYs = np.bincount(State.PointLabels, weights=State.PointYs, minlength=len(State.Incidents)) / State.Incidents
+            StationNames, StationDistances = Stations.assign(CentreXs, CentreYs)
 
-        #Identify, name and Load locations final output that includes index value, addresses, closest associated VicPol STN and customer details
-        AddressesofInterestLayer = iface.addVectorLayer(AddressesofInterest_params['OUTPUT'],AddressesofInterest[:-4], "ogr")
+            # Write the locations with their station and the distance to it as the output feature class
+            LOIAnalysisFields = QgsFields(LocationFields)
+            LOIAnalysisFields.append(AORReference.layer().fields().field('VicPolSTN'))
+            LOIAnalysisFields.append(QgsField("STN_DIST",QVariant.Double,"Double",10,1))
+            # The locations are taken in their rating order from the features still in memory, sharing their geometries
+            LOIAnalysisFeatures = []
+            for Rating, LocationId in enumerate(LocationOrder.tolist(), 1):
+                LOIFeature = QgsFeature(LOIAnalysisFields)
+                LOIFeature.setGeometry(LocationFeatures[LocationId].geometry())
+                LOIFeature.setAttributes([Rating, float(IncidentIndex[LocationId]), float(IdentityIndex[LocationId]), float(LocIndex[LocationId]),
+                                          int(Incidents[LocationId]), int(Identities[LocationId]), StationNames[LocationId],
+                                          None if np.isnan(StationDistances[LocationId]) else float(StationDistances[LocationId])])
+                LOIAnalysisFeatures.append(LOIFeature)
+            # The output is written once and the reports read the features still in memory rather than the file
+            LOIAnalysisPath = os.path.join(ShortPath,LOIName+OutputExtension)
+            self.writeFeatures(LOIAnalysisPath, LOIAnalysisFields, QgsWkbTypes.MultiPolygon, CoordSys, LOIAnalysisFeatures, context, OutputLayerOptions, OpenLayer=False)
+            Trace.end(len(LOIAnalysisFeatures))
 
-        # Delete Duplicate records on Order Number and Address 
-        LOIAddress_params = {
-            'FIELDS' : ['LOI','EZI_ADD'],
-            'INPUT' : AddressesofInterestLayer,
-            'OUTPUT' : ShortPath+'\\'+LOIAnalysis+"_Address.xlsx"
-            }
-        LOIAddress_outputs = processing.run('native:removeduplicatesbyattribute', LOIAddress_params)
-
-        # Join Address locations with Customer Name and Account Numbers
-        JoinAccts_params = {
-            'DISCARD_NONMATCHING': False,
-            'INPUT': LOIAnalysisLayer,
-            'JOIN': ipLocsSelectLayer,
-            'JOIN_FIELDS': ['CUSTOMER I', 'CUSTOMER N','IP ADDRESS'],
-            'METHOD': 0,  # Create separate feature for each matching feature (one-to-many)
-            'PREDICATE': [0],  # intersects
-            'PREFIX': '',
-            'OUTPUT': Analysispath+'\\'+JoinAccts
-            }
-        JoinAccts_outputs = processing.run('native:joinattributesbylocation', JoinAccts_params)
+            # The report rows start with the attributes of their location of interest, in LOI order
+            LOIFields = LOIAnalysisFields
 
-        #Identify, name and Load locations final output that includes index value, addresses, closest associated VicPol STN and customer details
-        JoinAcctsLayer = iface.addVectorLayer(JoinAccts_params['OUTPUT'],JoinAccts[:-4], "ogr")
+            # List the addresses inside each location from the address index, keeping each address once per LOI as it is found
+            Trace.begin('Address report' + Suffix, len(LOIAnalysisFeatures))
+            AddressReportPath = os.path.join(ShortPath,LOIName+"_Address.xlsx")
+            AddressFields = QgsFields(LOIFields)
+            AddressFields.append(AddressReference.layer().fields().field('EZI_ADD'))
+            AddressReport = ReportWriter(AddressReportPath, AddressFields, ReportFormats, context)
+            AddressValues = AddressReference.attribute('EZI_ADD')
+            for Location in LOIAnalysisFeatures:
+                if feedback.isCanceled():
+                    AddressReport.discard()
+                    raise QgsProcessingException(self.tr('The run was canceled'))
+                Engine = QgsGeometry.createGeometryEngine(Location.geometry().constGet())
+                Engine.prepareGeometry()
+                Seen = set()
+                for AddressId in sorted(AddressReference.Index.intersects(Location.geometry().boundingBox())):
+                    Address = AddressValues[AddressId]
+                    if Address in Seen or not Engine.intersects(AddressReference.Index.geometry(AddressId).constGet()):
+                        continue
+                    Seen.add(Address)
+                    AddressReport.add(Location.attributes() + [Address])
+                # Locations without an address are still listed
+                if not Seen:
+                    AddressReport.add(Location.attributes() + [None])
+            AddressReport.close()
+            Trace.end(AddressReport.Count)
 
-        # Delete Duplicate records on Order Number and Customer Details
-        LOIAccounts_params = {
-            'FIELDS' : ['LOI','CUSTOMER I','CUSTOMER N'],
-            'INPUT' : JoinAcctsLayer,
-            'OUTPUT' : ShortPath+'\\'+LOIAnalysis+"_Accounts.xlsx"
-            }
-        LOIAccounts_outputs = processing.run('native:removeduplicatesbyattribute', LOIAccounts_params)
+            # List the customers logging in at each location from its IP locations, once per customer per LOI
+            Trace.begin('Accounts report' + Suffix, len(State.PointRows))
+            AccountsReportPath = os.path.join(ShortPath,LOIName+"_Accounts.xlsx")
+            AccountsFields = QgsFields(LOIFields)
+            for Column in IPLocationColumns.Columns:
+                AccountsFields.append(self.columnField(Column,IPColumns.Values[Column]))
+            AccountsReport = ReportWriter(AccountsReportPath, AccountsFields, ReportFormats, context)
+            # Find the first IP location of each customer at each location by customer code, in spreadsheet order
+            Customers, CustomerCount = IPColumns.customers()
+            PointOrder = np.argsort(State.PointRows, kind='stable')
+            CustomerKeys = State.PointLabels[PointOrder].astype(np.int64) * CustomerCount + Customers[State.PointRows[PointOrder]]
+            FirstPoints = PointOrder[np.unique(CustomerKeys, return_index=True)[1]]
+            FirstPoints = FirstPoints[np.lexsort((State.PointRows[FirstPoints], State.PointLabels[FirstPoints]))]
+            LocationStarts = np.searchsorted(State.PointLabels[FirstPoints], np.arange(len(State.Incidents) + 1))
+            # Only the customers written to the report are decoded
+            for Location in LOIAnalysisFeatures:
+                if feedback.isCanceled():
+                    AccountsReport.discard()
+                    raise QgsProcessingException(self.tr('The run was canceled'))
+                LocationId = int(LocationOrder[Location['LOI'] - 1])
+                for Row in State.PointRows[FirstPoints[LocationStarts[LocationId]:LocationStarts[LocationId + 1]]].tolist():
+                    AccountsReport.add(Location.attributes() + [IPColumns.decode(Column,Row) for Column in IPLocationColumns.Columns])
+            AccountsReport.close()
+            Trace.end(AccountsReport.Count)
+            Results.append({'Distance': Distance, 'State': State, 'Ratings': Ratings, 'LocIndex': LocIndex, 'Name': LOIName,
+                            'LOI': LOIAnalysisPath, 'Address': AddressReportPath, 'Accounts': AccountsReportPath})
+
+        # Compare the rankings of the distances, one row for each location at the smallest distance. Locations only grow
+        # with the distance, so each of them lies in exactly one location at every larger distance, found from its first row
+        SweepPath = None
+        if len(Distances) > 1:
+            Finest = Results[0]
+            Trace.begin('Distance comparison', len(Finest['Ratings']))
+            SweepPath = os.path.join(ShortPath,LOIAnalysis+"_Sweep.xlsx")
+            SweepFields = QgsFields()
+            Columns = []
+            for Result in Results:
+                DistanceState = Result['State']
+                RowLocations = np.full(len(IPColumns), -1, dtype=np.int64)
+                RowLocations[DistanceState.PointRows] = DistanceState.PointLabels
+                Locations = RowLocations[Finest['State'].FirstRows[np.argsort(Finest['Ratings'])]]
+                for Name, Values, FieldType in [('LOI', Result['Ratings'], QVariant.Int), ('INCIDENTS', DistanceState.Incidents, QVariant.Int),
+                                                ('IDENTITIES', DistanceState.Identities, QVariant.Int), ('IndexCalc', Result['LocIndex'], QVariant.Double)]:
+                    SweepFields.append(QgsField('{} {}m'.format(Name, Result['Distance']), FieldType))
+                    Columns.append(Values[Locations])
+            SweepReport = ReportWriter(SweepPath, SweepFields, ReportFormats, context)
+            for Values in zip(*[Column.tolist() for Column in Columns]):
+                SweepReport.add(list(Values))
+            SweepReport.close()
+
+            # Report how closely the ranking at each distance follows the ranking at the next, 1 being the same order
+            for Smaller, Larger in zip(range(len(Results) - 1), range(1, len(Results))):
+                SmallerRanks = Columns[4 * Smaller].astype(float)
+                LargerRanks = Columns[4 * Larger].astype(float)
+                Correlation = np.corrcoef(SmallerRanks, LargerRanks)[0, 1] if SmallerRanks.std() > 0 and LargerRanks.std() > 0 else 1.0
+                feedback.pushInfo(self.tr('Rank correlation of the locations at {}m and {}m: {:.3f}').format(
+                    Results[Smaller]['Distance'], Results[Larger]['Distance'], Correlation))
+            Trace.end(SweepReport.Count)
+
+        Trace.write()
         
-        #Identify, name and Load locations with the closest associated VicPol STN
-        QgsProject.instance().removeMapLayer(LOIAnalysisLayer.id())
-        LOIAnalysisLayer = iface.addVectorLayer(LOIAnalysis_params['OUTPUT'],LOIAnalysis, "ogr")
+        #Identify, name and Load locations with the closest associated VicPol STN once the run completes
+        if LoadOutputs:
+            for Result in Results:
+                self.loadOnCompletion(Result['LOI'],Result['Name'],context)
         
-        return {}
-    
-    def flags(self):
-        return QgsProcessingAlgorithm.FlagNoThreading
+        # The outputs of the smallest distance are returned, with the comparison of all of them
+        return {self.OutputLOI: Results[0]['LOI'],
+                self.OutputAddressReport: Results[0]['Address'],
+                self.OutputAccountsReport: Results[0]['Accounts'],
+                self.OutputTrace: TracePath,
+                self.OutputSweep: SweepPath}
         
@@ -0,0 +1,197 @@
+"""
+Checks that the zoned, tiled and incremental ways of finding locations give
+the same locations as linking every pair of points directly.
+"""
+
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip('qgis.core')
+import VPCPSLOITool as Tool
+
+
+class PointSet:
+    """
+    Stands in for an outline as the set of points it was drawn around, so
+    outlines can be compared exactly without GEOS.
+    """
+
+    def __init__(self, Points=()):
+        self.Points = frozenset(Points)
+
+    @staticmethod
+    def unaryUnion(Parts):
+        return PointSet(frozenset().union(*[Part.Points for Part in Parts]))
+
+    def asWkb(self):
+        return pickle.dumps(sorted(self.Points))
+
+    def fromWkb(self, Wkb):
+        self.Points = frozenset(pickle.loads(bytes(Wkb)))
+
+    def transform(self, Transform):
+        pass
+
+
+def pointOutlines(Labels, xs, ys, Distance, LocationCount):
+    Outlines = [set() for Location in range(LocationCount)]
+    for Label, x, y in zip(np.asarray(Labels).tolist(), np.asarray(xs).tolist(), np.asarray(ys).tolist()):
+        Outlines[Label].add((x, y))
+    return [PointSet(Points) for Points in Outlines]
+
+
+class Feedback:
+
+    def isCanceled(self):
+        return False
+
+    def setProgress(self, Progress):
+        pass
+
+    def pushInfo(self, Text):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def outlines(monkeypatch):
+    monkeypatch.setattr(Tool, 'QgsGeometry', PointSet)
+    monkeypatch.setattr(Tool, 'locationGeometries', pointOutlines)
+    # Run the tiles in this process so they see the stand in outlines
+    monkeypatch.setattr(Tool, 'pythonExecutable', lambda: None)
+
+
+def bruteForce(xs, ys, LinkDistance):
+    """
+    Labels points by linking every pair within LinkDistance, numbering the
+    locations in the order of their first point.
+    """
+    Linked = (xs[:, None] - xs[None, :])**2 + (ys[:, None] - ys[None, :])**2 <= LinkDistance**2
+    Labels = np.full(len(xs), -1, dtype=np.int64)
+    LocationCount = 0
+    for Point in range(len(xs)):
+        if Labels[Point] >= 0:
+            continue
+        Labels[Point] = LocationCount
+        Pending = [Point]
+        while Pending:
+            Reached = np.nonzero(Linked[Pending.pop()] & (Labels < 0))[0]
+            Labels[Reached] = LocationCount
+            Pending.extend(Reached.tolist())
+        LocationCount += 1
+    return Labels
+
+
+def randomPoints(Generator, Count):
+    """
+    Returns points gathered around a few centres with repeated coordinates,
+    as IP locations are.
+    """
+    Centres = Generator.random((max(1, Count // 20), 2)) * 2000
+    Points = Centres[Generator.integers(0, len(Centres), Count)] + Generator.normal(0, 40, (Count, 2))
+    Points[Generator.random(Count) < 0.2] = Points[0]
+    return Points[:, 0].copy(), Points[:, 1].copy()
+
+
+def firstLabels(Labels):
+    """
+    Renumbers labels in the order of their first point.
+    """
+    Firsts = np.unique(Labels, return_index=True)[1]
+    Numbering = np.empty(int(Labels.max()) + 1, dtype=np.int64)
+    Numbering[Labels[np.sort(Firsts)]] = np.arange(len(Firsts))
+    return Numbering[Labels]
+
+
+@pytest.mark.parametrize('Seed', range(20))
+def test_cluster_points_matches_brute_force(Seed):
+    Generator = np.random.default_rng(Seed)
+    xs, ys = randomPoints(Generator, int(Generator.integers(1, 400)))
+    LinkDistance = float(Generator.integers(5, 120))
+    assert np.array_equal(Tool.clusterPoints(xs, ys, LinkDistance), bruteForce(xs, ys, LinkDistance))
+
+
+def test_connected_components():
+    Roots = Tool.connectedComponents([5, 1, 3, 6], [4, 2, 1, 5], 8)
+    assert Roots.tolist() == [0, 1, 1, 1, 4, 4, 4, 7]
+
+
+@pytest.mark.parametrize('Seed', range(20))
+def test_tiles_match_untiled(Seed):
+    Generator = np.random.default_rng(Seed)
+    xs, ys = randomPoints(Generator, int(Generator.integers(1, 400)))
+    Distance = float(Generator.integers(5, 60))
+    TileSize = float(Generator.integers(1, 800))
+    Labels, Outlines = Tool.locateByTile(xs, ys, Distance, TileSize, Feedback())
+    Expected = bruteForce(xs, ys, 2*Distance)
+    assert np.array_equal(firstLabels(Labels), Expected)
+    for Label, Outline in enumerate(Outlines):
+        Members = np.nonzero(Labels == Label)[0]
+        assert Outline.Points == set(zip(xs[Members].tolist(), ys[Members].tolist()))
+
+
+class Crs:
+
+    def authid(self):
+        return 'EPSG:4326'
+
+
+class Project:
+
+    @staticmethod
+    def instance():
+        return None
+
+
+def degreesToMetres(Lons, Lats, Transform=None):
+    """
+    Stands in for the projection of every zone with one plate carree, so
+    distances across zone edges are the same in every zone.
+    """
+    return np.asarray(Lons) * 111320.0, np.asarray(Lats) * 110574.0
+
+
+@pytest.mark.parametrize('Seed', range(20))
+def test_zones_match_single_projection(Seed, monkeypatch):
+    monkeypatch.setattr(Tool, 'transformCoordinates', degreesToMetres)
+    monkeypatch.setattr(Tool, 'QgsCoordinateTransform', lambda *Arguments: None)
+    monkeypatch.setattr(Tool, 'QgsCoordinateReferenceSystem', lambda *Arguments: None)
+    monkeypatch.setattr(Tool, 'QgsProject', Project)
+    Generator = np.random.default_rng(Seed)
+    # Points around 144 degrees east on the equator, where four zone partitions meet
+    xs, ys = randomPoints(Generator, int(Generator.integers(1, 400)))
+    Lons = 144.0 + (xs - 1000) / 111320.0
+    Lats = (ys - 1000) / 110574.0
+    Distance = float(Generator.integers(5, 60))
+    Labels, Outlines = Tool.locateByZone(Lons, Lats, Crs(), Distance, Feedback())
+    xs, ys = degreesToMetres(Lons, Lats)
+    assert np.array_equal(firstLabels(Labels), bruteForce(xs, ys, 2*Distance))
+    for Label, Outline in enumerate(Outlines):
+        Members = np.nonzero(Labels == Label)[0]
+        assert Outline.Points == set(zip(xs[Members].tolist(), ys[Members].tolist()))
+
+
+def ipColumns(Generator, Count):
+    Codes = {Column: Generator.integers(0, 30, Count).astype(np.int32) for Column in Tool.IPLocationColumns.Columns}
+    Values = {Column: ['{} {}'.format(Column, Code) for Code in range(30)] for Column in Tool.IPLocationColumns.Columns}
+    return Tool.IPLocationColumns(Generator.random(Count), Generator.random(Count), Codes, Values)
+
+
+@pytest.mark.parametrize('Seed', range(20))
+def test_extend_matches_full_build(Seed):
+    Generator = np.random.default_rng(Seed)
+    Count = int(Generator.integers(2, 400))
+    Columns = ipColumns(Generator, Count)
+    xs, ys = randomPoints(Generator, Count)
+    Rows = np.arange(Count)
+    Distance = float(Generator.integers(5, 60))
+    Split = int(Generator.integers(1, Count))
+    Full = Tool.LocationState.build({}, Columns, Rows, xs, ys, Distance)
+    State = Tool.LocationState.build({}, Columns, Rows[:Split], xs[:Split], ys[:Split], Distance)
+    State.extend(Columns, Rows[Split:], xs[Split:], ys[Split:], Distance)
+    assert np.array_equal(Full.PointLabels, bruteForce(xs, ys, 2*Distance))
+    for Name in ['PointRows', 'PointLabels', 'Incidents', 'FirstRows', 'CustomerLabels', 'CustomerCodes', 'Identities']:
+        assert np.array_equal(getattr(State, Name), getattr(Full, Name)), Name
+    assert [Outline.Points for Outline in State.Outlines] == [Outline.Points for Outline in Full.Outlines]
+    assert State.RowDigest == Full.RowDigest
@@ -0,0 +1,185 @@
+"""
+Checks the station assignment, index scores and buffer distances that rank
+and label the locations of interest.
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip('qgis.core')
+import VPCPSLOITool as Tool
+
+
+class Point:
+    """
+    Stands in for a point, as a geometry and as its own centroid.
+    """
+
+    def __init__(self, x, y=None):
+        if y is None:
+            x, y = x.x(), x.y()
+        self.X = x
+        self.Y = y
+
+    def x(self):
+        return self.X
+
+    def y(self):
+        return self.Y
+
+    def isEmpty(self):
+        return False
+
+    def centroid(self):
+        return self
+
+    def asPoint(self):
+        return self
+
+
+class Box:
+    """
+    Stands in for a rectangular police area of responsibility, so points can
+    be tested against it and measured to it without GEOS.
+    """
+
+    def __init__(self, XMin, YMin, XMax, YMax):
+        self.XMin, self.YMin, self.XMax, self.YMax = XMin, YMin, XMax, YMax
+
+    def boundingBox(self):
+        return self
+
+    def xMinimum(self):
+        return self.XMin
+
+    def yMinimum(self):
+        return self.YMin
+
+    def xMaximum(self):
+        return self.XMax
+
+    def yMaximum(self):
+        return self.YMax
+
+    def constGet(self):
+        return self
+
+    def prepareGeometry(self):
+        pass
+
+    def intersects(self, Location):
+        return self.XMin <= Location.x() <= self.XMax and self.YMin <= Location.y() <= self.YMax
+
+    def distance(self, Location):
+        return math.hypot(max(self.XMin - Location.x(), 0, Location.x() - self.XMax),
+                          max(self.YMin - Location.y(), 0, Location.y() - self.YMax))
+
+
+class Geometry:
+    """
+    Stands in for QgsGeometry where StationLookup builds and prepares geometries.
+    """
+
+    @staticmethod
+    def createGeometryEngine(Area):
+        return Area
+
+    @staticmethod
+    def fromPointXY(Location):
+        return Location
+
+
+class Index:
+    """
+    Stands in for the spatial index of a reference layer, holding its geometries.
+    """
+
+    def __init__(self, Geometries):
+        self.Geometries = Geometries
+
+    def geometry(self, FeatureId):
+        return self.Geometries[FeatureId]
+
+    def nearestNeighbor(self, Location, Neighbors):
+        return sorted(self.Geometries, key=lambda FeatureId: self.Geometries[FeatureId].distance(Location))[:Neighbors]
+
+
+class Reference:
+    """
+    Stands in for a reference layer, with the values of one field by feature id.
+    """
+
+    def __init__(self, Geometries, Values):
+        self.Index = Index(Geometries)
+        self.Values = Values
+
+    def attribute(self, FieldName):
+        return self.Values
+
+
+@pytest.fixture(autouse=True)
+def geometries(monkeypatch):
+    monkeypatch.setattr(Tool, 'QgsGeometry', Geometry)
+    monkeypatch.setattr(Tool, 'QgsPoint', Point)
+    monkeypatch.setattr(Tool, 'QgsPointXY', Point)
+
+
+def areas():
+    # Two areas side by side, with a gap between them
+    return Reference({1: Box(0, 0, 100, 100), 2: Box(200, 0, 300, 100)}, {1: 'North Melbourne', 2: 'Carlton'})
+
+
+def test_station_of_the_area_or_the_nearest_station():
+    Stations = Reference({7: Point(50, 50), 8: Point(500, 50)}, {7: '  north   MELBOURNE ', 8: 'Footscray'})
+    Lookup = Tool.StationLookup(areas(), 'VicPolSTN', Stations, 'STATION')
+    Names, Distances = Lookup.assign([50, 80, 450, 150], [20, 50, 50, 50])
+    # Inside an area the station is the area's, found by name whatever its case and spacing
+    assert list(Names[:2]) == ['North Melbourne', 'North Melbourne']
+    assert Distances[:2] == pytest.approx([30, 30])
+    # Outside every area the nearest station point is taken, even when it is further than an area
+    assert list(Names[2:]) == ['Footscray', '  north   MELBOURNE ']
+    assert Distances[2:] == pytest.approx([50, 100])
+
+
+def test_area_without_a_station_point_has_no_distance():
+    Stations = Reference({7: Point(50, 50)}, {7: 'North Melbourne'})
+    Names, Distances = Tool.StationLookup(areas(), 'VicPolSTN', Stations, 'STATION').assign([250], [50])
+    # The area keeps its own station, rather than the distance to another station
+    assert list(Names) == ['Carlton']
+    assert np.isnan(Distances[0])
+
+
+def test_station_of_the_nearest_area_without_station_points():
+    Names, Distances = Tool.StationLookup(areas(), 'VicPolSTN').assign([50, 160, 330], [50, 50, 140])
+    assert list(Names) == ['North Melbourne', 'Carlton', 'Carlton']
+    assert Distances == pytest.approx([0, 40, 50])
+
+
+def test_normalise_index():
+    assert Tool.normaliseIndex([1, 3, 5]).tolist() == [0, 0.5, 1]
+    # Without a range to scale over every value scores 0
+    assert Tool.normaliseIndex([4, 4, 4]).tolist() == [0, 0, 0]
+    assert Tool.normaliseIndex([]).size == 0
+
+
+def test_score_locations():
+    IncidentIndex, IdentityIndex, LocIndex = Tool.scoreLocations([10, 20, 30], [5, 5, 5])
+    assert IncidentIndex.tolist() == [0, 0.5, 1]
+    assert IdentityIndex.tolist() == [0, 0, 0]
+    assert LocIndex.tolist() == [0, 25, 50]
+    assert Tool.scoreLocations([2, 1], [1, 3])[2].tolist() == [50, 50]
+
+
+@pytest.mark.parametrize('Text, Expected', [('50', [50]), ('100, 25;50 25', [25, 50, 100]), ('12.5,50.0', [12.5, 50])])
+def test_parse_distances(Text, Expected):
+    Distances = Tool.VPCPSLOITool().parseDistances(Text)
+    assert Distances == Expected
+    assert [type(Distance) for Distance in Distances] == [type(Distance) for Distance in Expected]
+
+
+@pytest.mark.parametrize('Text', ['', ' , ', '0', '-5', '50,metres'])
+def test_parse_distances_rejects(Text):
+    with pytest.raises(Tool.QgsProcessingException):
+        Tool.VPCPSLOITool().parseDistances(Text)